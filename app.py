@@ -3,7 +3,13 @@ from flask import Flask
 from datetime import timedelta
 import os
 from models import db
-from routes import auth_bp, admin_bp, employee_bp, manager_bp
+from commands import register_commands
+import compression
+import database
+import migrations
+import revocation
+import passwords
+from routes import auth_bp, admin_bp, employee_bp, manager_bp, health_bp
 from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 
@@ -16,6 +22,16 @@ def create_app():
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'postgresql://postgres:postgres123@db:5432/employee_management')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool sizing, pre-ping, recycling and statement timeout (DB_* variables)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    # Optional read replica for GET requests in the admin and employee APIs
+    replica_url = os.environ.get('REPLICA_DATABASE_URL')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {
+            database.REPLICA_BIND: {'url': replica_url, **database.engine_options(replica_url)}
+        }
+    # Apply pending migrations at startup; disable to require 'flask upgrade-db'
+    app.config['SCHEMA_AUTO_UPGRADE'] = os.environ.get('SCHEMA_AUTO_UPGRADE', '1') == '1'
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')  # Change in production
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)  # Session timeout after 30 minutes
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'your_jwt_secret_key')
@@ -23,6 +39,42 @@ def create_app():
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(hours=1)
     app.config['JWT_BLACKLIST_ENABLED'] = True
     app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access', 'refresh']
+    # Upper bound, in seconds, on how long a cached principal (role, emp_id, department) is kept
+    app.config['PRINCIPAL_CACHE_TTL'] = int(os.environ.get('PRINCIPAL_CACHE_TTL', 60))
+    app.config['PRINCIPAL_CACHE_SIZE'] = int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000))
+    # Upper bound, in seconds, on how long a role change in one worker goes unseen by the others
+    app.config['PRINCIPAL_SYNC_SECONDS'] = float(os.environ.get('PRINCIPAL_SYNC_SECONDS', 5))
+    # Cached JSON responses of polled read endpoints; invalidated by data version, TTL bounds memory
+    app.config['HTTP_CACHE_TTL'] = int(os.environ.get('HTTP_CACHE_TTL', 300))
+    app.config['HTTP_CACHE_SIZE'] = int(os.environ.get('HTTP_CACHE_SIZE', 5000))
+    # Seconds the per-department dashboard stats are reused before being recomputed
+    app.config['DEPARTMENT_STATS_TTL'] = int(os.environ.get('DEPARTMENT_STATS_TTL', 30))
+    # Upper bound, in seconds, on how long a holiday change goes unseen by leave balance reads
+    app.config['CALENDAR_SYNC_SECONDS'] = float(os.environ.get('CALENDAR_SYNC_SECONDS', 30))
+    # Upper bound, in seconds, on how long a logout in one worker goes unseen by the others
+    app.config['REVOCATION_SYNC_SECONDS'] = float(os.environ.get('REVOCATION_SYNC_SECONDS', 5))
+    # Password hashing: werkzeug method string (sets the cost), and the bounded
+    # pool logins hash on; beyond workers + queue, or after the timeout in
+    # seconds, logins get a 503 asking the client to retry
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 64))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    app.config['PASSWORD_HASH_RETRY_AFTER'] = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 1))
+
+    # Worker processes rendering PDFs for bulk exports (defaults to one per CPU)
+    app.config['EXPORT_PDF_WORKERS'] = int(os.environ.get('EXPORT_PDF_WORKERS', 0)) or None
+    # Background export jobs: where results are kept, for how long, and when a
+    # running job is considered abandoned
+    app.config['EXPORT_DIR'] = os.environ.get('EXPORT_DIR', os.path.join(app.instance_path, 'exports'))
+    app.config['EXPORT_RESULT_TTL_HOURS'] = int(os.environ.get('EXPORT_RESULT_TTL_HOURS', 24))
+    app.config['EXPORT_JOB_TIMEOUT'] = int(os.environ.get('EXPORT_JOB_TIMEOUT', 3600))
+    # Rendered single-employee reports, keyed by data version, with LRU eviction
+    app.config['REPORT_CACHE_DIR'] = os.environ.get('REPORT_CACHE_DIR', os.path.join(app.instance_path, 'report_cache'))
+    app.config['REPORT_CACHE_MAX_BYTES'] = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    # gzip/deflate for text responses: bodies below the threshold are sent as is
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
 
     # Configure secure cookies
     app.config['SESSION_COOKIE_SECURE'] = True  # Only send over HTTPS
@@ -33,18 +85,16 @@ def create_app():
     # login_manager = LoginManager()
     # login_manager.init_app(app)
     db.init_app(app)
+    database.init_app(app, db)
     jwt = JWTManager(app)
 
-    blacklist = set()
-
-    @jwt.token_in_blocklist_loader
-    def check_if_token_revoked(jwt_header, jwt_payload):
-        jti = jwt_payload['jti']
-        return jti in blacklist
+    revocation.init_app(app, jwt)
+    passwords.init_app(app)
+    compression.init_app(app)
 
-    # Create database tables
+    # Bring the schema up to date once; a single version query when it already is
     with app.app_context():
-        db.create_all()
+        migrations.ensure_schema()
 
     # User loader function for Flask-Login
     # @login_manager.user_loader
@@ -57,6 +107,9 @@ def create_app():
     app.register_blueprint(admin_bp)
     app.register_blueprint(employee_bp)
     app.register_blueprint(manager_bp)
+    app.register_blueprint(health_bp)
+
+    register_commands(app)
 
     return app
 
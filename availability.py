@@ -0,0 +1,158 @@
+"""Who is out on each day of a window, for team coverage planning."""
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from flask import jsonify, request
+from sqlalchemy import Integer, bindparam, case, cast, func, literal, select, type_coerce, union_all
+
+from business_days import get_business_calendar
+from models import db, User, EmployeeProfile, LeaveRequest, Attendance, ACTIVE_LEAVE_STATUSES
+
+DEFAULT_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 366
+
+# When someone is out for several reasons on one day, report the first that applies
+ABSENCE_PRIORITY = ('leave', 'pending_leave', 'absent')
+LEAVE, PENDING_LEAVE, ABSENT = range(len(ABSENCE_PRIORITY))
+
+
+def _day_offset(column, start):
+    """Days from `start` to `column` as an integer computed by the database"""
+    if db.engine.dialect.name == 'postgresql':
+        return type_coerce(column - literal(start), Integer)
+    return cast(func.julianday(column) - func.julianday(literal(start)), Integer)
+
+
+def absence_intervals(member_ids, start, end):
+    """(user_id, first_offset, last_offset, priority) tuples for absences touching [start, end], sorted.
+
+    Offsets count days from `start` and may fall outside the window;
+    priority indexes ABSENCE_PRIORITY.
+    """
+    leave = select(
+        LeaveRequest.employee_id,
+        _day_offset(LeaveRequest.start_date, start),
+        _day_offset(LeaveRequest.end_date, start),
+        case((LeaveRequest.status == 'approved', literal(LEAVE)), else_=literal(PENDING_LEAVE)),
+    ).where(
+        LeaveRequest.employee_id.in_(member_ids),
+        LeaveRequest.status.in_(ACTIVE_LEAVE_STATUSES),
+        LeaveRequest.end_date >= start,
+        LeaveRequest.start_date <= end,
+    )
+    offset = _day_offset(Attendance.date, start)
+    attendance = select(
+        Attendance.user_id,
+        offset,
+        offset,
+        case((Attendance.status == 'leave', literal(LEAVE)), else_=literal(ABSENT)),
+    ).where(
+        Attendance.user_id.in_(member_ids),
+        # Rendered inline so the planner can match the partial absences index
+        Attendance.status.in_(bindparam('absence_statuses', ('absent', 'leave'), expanding=True,
+                                        literal_execute=True)),
+        Attendance.date >= start,
+        Attendance.date <= end,
+    ).order_by(None)
+    # Plain tuples of numbers sort faster than rows and drop out of garbage collection
+    return sorted(map(tuple, db.session.execute(union_all(leave, attendance))))
+
+
+def _settle_overlaps(runs):
+    """Rewrite one person's overlapping (first, last, priority) runs so each day keeps the reason that applies first"""
+    days = {}
+    for first, last, priority in runs:
+        for day in range(first, last + 1):
+            if priority < days.get(day, len(ABSENCE_PRIORITY)):
+                days[day] = priority
+    return [(day, day, days[day]) for day in sorted(days)]
+
+
+def sweep_absences(intervals, length):
+    """Sweep absence intervals, ordered by user and first day, over day offsets 0..length-1.
+
+    Returns (out_per_day, periods): the number of people out on each day,
+    and for each person the (first, last, priority) runs, clipped to the
+    window, during which their reported reason stays the same.
+    """
+    changes = [0] * (length + 1)
+    periods = {}
+    for user_id, rows in groupby(intervals, key=itemgetter(0)):
+        runs = [(first if first > 0 else 0, last if last < length else length - 1, priority)
+                for _, first, last, priority in rows]
+        # Usually a person's absences do not overlap and each is a run as it is
+        if any(runs[index][0] <= runs[index - 1][1] for index in range(1, len(runs))):
+            runs = _settle_overlaps(runs)
+        merged = [runs[0]]
+        for run in runs[1:]:
+            previous = merged[-1]
+            if run[0] == previous[1] + 1 and run[2] == previous[2]:
+                merged[-1] = (previous[0], run[1], run[2])
+            else:
+                merged.append(run)
+        for first, last, _ in merged:
+            changes[first] += 1
+            changes[last + 1] -= 1
+        periods[user_id] = merged
+
+    out_per_day = []
+    out = 0
+    for change in changes[:length]:
+        out += change
+        out_per_day.append(out)
+    return out_per_day, periods
+
+
+def availability_response(*member_criteria):
+    """Per-day availability of the users matching `member_criteria` for ?from=&to="""
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() \
+            if request.args.get('from') else datetime.utcnow().date()
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() \
+            if request.args.get('to') else start + timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    if start > end:
+        return jsonify({"error": "'from' cannot be after 'to'"}), 400
+    length = (end - start).days + 1
+    if length > MAX_WINDOW_DAYS:
+        return jsonify({"error": f"Window cannot exceed {MAX_WINDOW_DAYS} days"}), 400
+
+    members = {
+        user_id: (emp_id, full_name or emp_id)
+        for user_id, emp_id, full_name in db.session.query(User.id, User.emp_id, EmployeeProfile.full_name)
+        .outerjoin(EmployeeProfile, EmployeeProfile.user_id == User.id).filter(*member_criteria)
+    }
+    member_ids = db.session.query(User.id).filter(*member_criteria).scalar_subquery()
+    # Ignore anyone who joined the team between the two queries
+    intervals = [row for row in absence_intervals(member_ids, start, end) if row[0] in members] if members else []
+    out_per_day, periods = sweep_absences(intervals, length)
+
+    dates = [(start + timedelta(days=offset)) for offset in range(length)]
+    labels = [day.strftime('%Y-%m-%d') for day in dates]
+    calendar = get_business_calendar()
+    days = [{
+        "date": labels[offset],
+        "business_day": calendar.is_business_day(dates[offset]),
+        "available": len(members) - out
+    } for offset, out in enumerate(out_per_day)]
+
+    # Who is out is reported once per ISO 8601 date range rather than on every day
+    absences = []
+    for user_id, runs in sorted(periods.items(), key=lambda item: members[item[0]][1]):
+        out = {}
+        for first, last, priority in runs:
+            out.setdefault(ABSENCE_PRIORITY[priority], []).append(
+                labels[first] if first == last else f"{labels[first]}/{labels[last]}"
+            )
+        emp_id, name = members[user_id]
+        absences.append({"emp_id": emp_id, "name": name, "out": out})
+
+    return jsonify({
+        "from": labels[0],
+        "to": labels[-1],
+        "headcount": len(members),
+        "days": days,
+        "absences": absences
+    }), 200
@@ -0,0 +1,77 @@
+"""Working-day arithmetic over the holiday calendar."""
+import threading
+import time
+from datetime import date, timedelta
+
+from flask import current_app
+
+from models import db, DataVersion, Holiday
+
+# date.weekday() values of Saturday and Sunday
+WEEKEND = frozenset((5, 6))
+
+
+class BusinessCalendar:
+
+    def __init__(self, holidays=(), version=0):
+        self.holidays = frozenset(holidays)
+        self.version = version
+        self._prefix_sums = {}
+
+    def is_business_day(self, day):
+        return day.weekday() not in WEEKEND and day not in self.holidays
+
+    def _prefix(self, year):
+        prefix = self._prefix_sums.get(year)
+        if prefix is None:
+            first = date(year, 1, 1)
+            length = (date(year + 1, 1, 1) - first).days
+            prefix = [0] * (length + 1)
+            for i in range(length):
+                prefix[i + 1] = prefix[i] + self.is_business_day(first + timedelta(days=i))
+            self._prefix_sums[year] = prefix
+        return prefix
+
+    def business_days(self, start_date, end_date):
+        """Working days in the inclusive range start_date..end_date"""
+        if end_date < start_date:
+            return 0
+        total = 0
+        for year in range(start_date.year, end_date.year + 1):
+            prefix = self._prefix(year)
+            first = start_date.timetuple().tm_yday - 1 if year == start_date.year else 0
+            last = end_date.timetuple().tm_yday if year == end_date.year else len(prefix) - 1
+            total += prefix[last] - prefix[first]
+        return total
+
+
+_lock = threading.Lock()
+
+
+def get_business_calendar(max_age=None):
+    """The process-wide calendar, reloaded if the holidays changed.
+
+    The holidays version is checked when the cached calendar is older than
+    `max_age` seconds (``CALENDAR_SYNC_SECONDS`` by default); pass 0 to
+    always check.
+    """
+    state = current_app.extensions.setdefault('business_calendar', {"calendar": None, "checked": 0.0})
+    if max_age is None:
+        max_age = current_app.config['CALENDAR_SYNC_SECONDS']
+    now = time.monotonic()
+    calendar = state["calendar"]
+    if calendar is not None and now - state["checked"] < max_age:
+        return calendar
+
+    version = db.session.query(DataVersion.version).filter(DataVersion.scope == 'holidays').scalar() or 0
+    if calendar is None or calendar.version != version:
+        calendar = BusinessCalendar([day for day, in db.session.query(Holiday.date)], version)
+    with _lock:
+        state["calendar"] = calendar
+        state["checked"] = now
+    return calendar
+
+
+def invalidate_business_calendar():
+    """Drop this process's calendar, e.g. after rolling back a holiday change"""
+    current_app.extensions.pop('business_calendar', None)
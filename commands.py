@@ -0,0 +1,113 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import (db, AttendanceMonthly, LeaveLedger, bump_data_versions, bump_scope_versions,
+                    compute_attendance_rollup, compute_leave_ledger)
+import migrations
+import export_jobs
+
+
+@click.command('rebuild-leave-ledger')
+@click.option('--dry-run', is_flag=True, help='Only report drift, do not rewrite the ledger.')
+@with_appcontext
+def rebuild_leave_ledger(dry_run):
+    """Rebuild the leave ledger from leave history and report any drift."""
+    live = compute_leave_ledger()
+    stored = {
+        (entry.user_id, entry.year): (entry.days_taken, entry.days_pending)
+        for entry in LeaveLedger.query.all()
+    }
+
+    drifted_users = set()
+    drift = 0
+    for key in sorted(set(live) | set(stored)):
+        expected = live.get(key, (0, 0))
+        actual = stored.get(key, (0, 0))
+        if expected != actual:
+            drift += 1
+            user_id, year = key
+            drifted_users.add(user_id)
+            click.echo(
+                f"user {user_id} year {year}: ledger taken={actual[0]} pending={actual[1]}, "
+                f"live taken={expected[0]} pending={expected[1]}"
+            )
+    click.echo(f"{drift} ledger entries drifted from leave history")
+
+    if dry_run:
+        return
+
+    LeaveLedger.query.delete()
+    db.session.bulk_insert_mappings(LeaveLedger, [
+        {"user_id": user_id, "year": year, "days_taken": taken, "days_pending": pending}
+        for (user_id, year), (taken, pending) in live.items()
+    ])
+    # Balances served from cache were computed from the drifted entries
+    bump_data_versions(drifted_users)
+    bump_scope_versions(['leave'])
+    db.session.commit()
+    click.echo(f"Rebuilt {len(live)} ledger entries")
+
+
+@click.command('rebuild-attendance-rollup')
+@click.option('--dry-run', is_flag=True, help='Only report drift, do not rewrite the rollup.')
+@with_appcontext
+def rebuild_attendance_rollup(dry_run):
+    """Backfill the monthly attendance rollup from raw attendance and report any drift."""
+    live = compute_attendance_rollup()
+    stored = {
+        (entry.user_id, entry.month): (entry.present, entry.absent, entry.leave)
+        for entry in AttendanceMonthly.query.all()
+    }
+
+    drift = 0
+    for key in sorted(set(live) | set(stored)):
+        expected = live.get(key, (0, 0, 0))
+        actual = stored.get(key, (0, 0, 0))
+        if expected != actual:
+            drift += 1
+            user_id, month = key
+            click.echo(
+                f"user {user_id} month {month:%Y-%m}: rollup present={actual[0]} absent={actual[1]} "
+                f"leave={actual[2]}, live present={expected[0]} absent={expected[1]} leave={expected[2]}"
+            )
+    click.echo(f"{drift} rollup entries drifted from attendance")
+
+    if dry_run:
+        return
+
+    AttendanceMonthly.query.delete()
+    db.session.bulk_insert_mappings(AttendanceMonthly, [
+        {"user_id": user_id, "month": month, "present": present, "absent": absent, "leave": leave}
+        for (user_id, month), (present, absent, leave) in live.items()
+    ])
+    db.session.commit()
+    click.echo(f"Rebuilt {len(live)} rollup entries")
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db():
+    """Create missing tables and apply pending schema migrations."""
+    applied = migrations.upgrade()
+    for version, description in applied:
+        click.echo(f"Applied migration {version}: {description}")
+    click.echo(f"Schema is at version {migrations.latest_version()}")
+
+
+@click.command('export-worker')
+@click.option('--concurrency', default=1, show_default=True, help='Jobs processed in parallel.')
+@click.option('--poll-interval', default=2.0, show_default=True, help='Seconds to wait when the queue is empty.')
+@click.option('--once', is_flag=True, help='Exit once the queue is empty.')
+@with_appcontext
+def export_worker(concurrency, poll_interval, once):
+    """Run queued report exports."""
+    app = current_app._get_current_object()
+    click.echo(f"Export worker started with {concurrency} thread(s)")
+    export_jobs.run_worker(app, concurrency, poll_interval, once)
+
+
+def register_commands(app):
+    app.cli.add_command(rebuild_leave_ledger)
+    app.cli.add_command(rebuild_attendance_rollup)
+    app.cli.add_command(upgrade_db)
+    app.cli.add_command(export_worker)
@@ -0,0 +1,68 @@
+"""Engine configuration and read-replica routing."""
+import os
+
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = 'replica'
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for `url` from the DB_* environment variables"""
+    url = make_url(url)
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    # In-memory SQLite uses a single-connection pool without sizing knobs
+    if url.get_backend_name() != 'sqlite' or url.database not in (None, '', ':memory:'):
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    if url.get_backend_name() == 'postgresql' and statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+class RoutingSession(Session):
+    """Session sending reads to the replica bind when the request opted in"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_app_context() and g.get('use_replica')
+                and REPLICA_BIND in self._db.engines):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica():
+    """Route the rest of this request's ORM reads to the replica, if one is configured"""
+    g.use_replica = True
+
+
+def route_reads_to_replica():
+    """``before_request`` hook sending the ORM reads of GET and HEAD requests to the replica"""
+    if request.method in ('GET', 'HEAD'):
+        use_replica()
+
+
+def _read_only_statement(dialect_name):
+    if dialect_name == 'sqlite':
+        return 'PRAGMA query_only = ON'
+    return 'SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY'
+
+
+def init_app(app, db):
+    with app.app_context():
+        replica = db.engines.get(REPLICA_BIND)
+    if replica is None:
+        return
+    statement = _read_only_statement(replica.dialect.name)
+
+    @event.listens_for(replica, 'connect')
+    def set_read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(statement)
+        cursor.close()
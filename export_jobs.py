@@ -0,0 +1,166 @@
+"""Background export jobs."""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from models import db, ExportJob, User
+from exports import generate_employee_pdf, iter_employee_csv, iter_employee_pdf_zip, scoped_users
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'pdf', 'zip')
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'pdf': 'application/pdf',
+    'zip': 'application/zip',
+}
+
+# Seconds between expired-job sweeps in a worker
+CLEANUP_INTERVAL = 300
+
+
+def export_dir():
+    path = current_app.config['EXPORT_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def enqueue(export_format, params, requested_by=None):
+    job = ExportJob(format=export_format, params=params, status='queued', requested_by=requested_by)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def claim_next():
+    """Claim the oldest queued job, or return None when the queue is empty"""
+    while True:
+        job_id = db.session.query(ExportJob.id).filter(
+            ExportJob.status == 'queued'
+        ).order_by(ExportJob.id).limit(1).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        claimed = db.session.execute(
+            update(ExportJob)
+            .where(ExportJob.id == job_id, ExportJob.status == 'queued')
+            .values(status='running', started_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(ExportJob, job_id)
+        # Another worker got there first; try the next job
+
+
+def _set_progress(job_id, done):
+    # Separate connection: the export's own session may hold an open cursor
+    with db.engine.begin() as conn:
+        conn.execute(update(ExportJob).where(ExportJob.id == job_id).values(progress=done))
+
+
+def run_job(job):
+    """Produce the export file for a claimed job and record the outcome"""
+    params = job.params or {}
+    user_ids = params.get('user_ids')
+    department_id = params.get('department_id')
+    path = os.path.join(export_dir(), f"export_{job.id}.{job.format}")
+    partial = path + '.part'
+
+    job.total = scoped_users(user_ids, department_id).count()
+    db.session.commit()
+    job_id = job.id
+    done = 0
+
+    def on_batch(count):
+        nonlocal done
+        done += count
+        _set_progress(job_id, done)
+
+    try:
+        if job.format == 'csv':
+            with open(partial, 'w', encoding='utf-8', newline='') as output:
+                for chunk in iter_employee_csv(user_ids, department_id, on_batch=on_batch):
+                    output.write(chunk)
+        elif job.format == 'zip':
+            workers = current_app.config['EXPORT_PDF_WORKERS']
+            with open(partial, 'wb') as output:
+                for chunk in iter_employee_pdf_zip(user_ids, department_id, workers, on_batch):
+                    output.write(chunk)
+        else:
+            with open(partial, 'wb') as output:
+                output.write(generate_employee_pdf(db.session.get(User, user_ids[0])).getvalue())
+            on_batch(1)
+        os.replace(partial, path)
+    except Exception as e:
+        logger.exception("Export job %s failed", job_id)
+        db.session.rollback()
+        if os.path.exists(partial):
+            os.remove(partial)
+        _finish(job_id, status='failed', error=str(e))
+        return
+
+    _finish(job_id, status='done', file_path=path)
+
+
+def _finish(job_id, **values):
+    now = datetime.utcnow()
+    ttl = timedelta(hours=current_app.config['EXPORT_RESULT_TTL_HOURS'])
+    db.session.execute(
+        update(ExportJob).where(ExportJob.id == job_id)
+        .values(finished_at=now, expires_at=now + ttl, **values)
+    )
+    db.session.commit()
+
+
+def cleanup_expired():
+    """Delete expired jobs and their files; fail jobs whose worker vanished"""
+    now = datetime.utcnow()
+    expired = ExportJob.query.filter(ExportJob.expires_at < now).all()
+    for job in expired:
+        if job.file_path and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        db.session.delete(job)
+
+    stale_before = now - timedelta(seconds=current_app.config['EXPORT_JOB_TIMEOUT'])
+    stale = ExportJob.query.filter(ExportJob.status == 'running', ExportJob.started_at < stale_before).all()
+    for job in stale:
+        _finish(job.id, status='failed', error="Export worker stopped before finishing")
+    db.session.commit()
+    return len(expired), len(stale)
+
+
+def run_worker(app, concurrency=1, poll_interval=2.0, once=False):
+    """Process queued jobs with `concurrency` threads until interrupted.
+
+    With `once`, drain the queue and return instead of polling.
+    """
+    stop = threading.Event()
+
+    def loop():
+        last_cleanup = None
+        while not stop.is_set():
+            with app.app_context():
+                if last_cleanup is None or time.monotonic() - last_cleanup > CLEANUP_INTERVAL:
+                    cleanup_expired()
+                    last_cleanup = time.monotonic()
+                job = claim_next()
+                if job is not None:
+                    run_job(job)
+                    continue
+            if once:
+                return
+            stop.wait(poll_interval)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(loop) for _ in range(concurrency)]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            stop.set()
@@ -0,0 +1,356 @@
+"""Employee report exports."""
+import csv
+import os
+import threading
+import zipfile
+from collections import defaultdict, deque
+from datetime import datetime
+from io import BytesIO, StringIO
+
+from werkzeug.utils import secure_filename
+
+from business_days import get_business_calendar
+from models import db, User, LeaveRequest, Attendance, leave_balances_for
+
+# Users loaded per batch and attendance rows fetched per round trip
+EXPORT_USER_BATCH = 500
+EXPORT_PDF_USER_BATCH = 100
+EXPORT_ROW_BATCH = 5000
+# Buffered CSV text handed to the client per chunk
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+
+def scoped_users(user_ids=None, department_id=None):
+    """User query restricted to an export scope"""
+    query = User.query
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+    if department_id is not None:
+        query = query.filter(User.department_id == department_id)
+    return query
+
+
+def iter_user_batches(user_ids=None, department_id=None, batch_size=EXPORT_USER_BATCH, on_batch=None):
+    """Yield lists of users, with profile and department loaded, in id order.
+
+    `on_batch`, if given, is called with the batch size once the consumer
+    has finished with each batch.
+    """
+    last_id = 0
+    while True:
+        query = scoped_users(user_ids, department_id).options(
+            db.joinedload(User.profile), db.joinedload(User.department)
+        ).filter(User.id > last_id).order_by(User.id)
+        batch = query.limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        if on_batch:
+            on_batch(len(batch))
+        last_id = batch[-1].id
+        # Keep the identity map from growing with the export
+        for user in batch:
+            db.session.expunge(user)
+
+
+def fetch_leaves(user_ids):
+    """Leave requests for a batch of users as {user_id: [row, ...]}"""
+    leaves = defaultdict(list)
+    rows = db.session.execute(
+        db.select(
+            LeaveRequest.employee_id, LeaveRequest.start_date, LeaveRequest.end_date,
+            LeaveRequest.reason, LeaveRequest.status
+        ).where(LeaveRequest.employee_id.in_(user_ids)).order_by(LeaveRequest.employee_id, LeaveRequest.id)
+    )
+    for row in rows:
+        leaves[row.employee_id].append(row)
+    return leaves
+
+
+def stream_attendance(user_ids):
+    """Attendance rows for a batch of users ordered by user and date, fetched in chunks"""
+    return db.session.execute(
+        db.select(
+            Attendance.user_id, Attendance.date, Attendance.status,
+            Attendance.check_in_time, Attendance.check_out_time
+        ).where(Attendance.user_id.in_(user_ids))
+        .order_by(Attendance.user_id, Attendance.date)
+        .execution_options(yield_per=EXPORT_ROW_BATCH)
+    )
+
+
+def iter_employee_csv(user_ids=None, department_id=None, separator='\n\n', on_batch=None):
+    """Yield the CSV report for the selected users in chunks.
+
+    Each employee's section is followed by `separator`. Attendance is merged
+    in from a single ordered cursor per batch, so memory stays bounded by the
+    batch size rather than by the history of any one employee.
+    """
+    output = StringIO()
+    writer = csv.writer(output)
+    year = datetime.utcnow().year
+
+    def flush():
+        chunk = output.getvalue()
+        output.seek(0)
+        output.truncate()
+        return chunk
+
+    calendar = get_business_calendar()
+
+    for batch in iter_user_batches(user_ids, department_id, on_batch=on_batch):
+        ids = [user.id for user in batch]
+        balances = leave_balances_for(ids, year)
+        leaves = fetch_leaves(ids)
+        attendance = iter(stream_attendance(ids))
+        record = next(attendance, None)
+
+        for user in batch:
+            profile = user.profile
+            writer.writerow(['Employee Details'])
+            writer.writerow(['emp_id', 'full_name', 'email', 'role', 'department', 'leave_balance'])
+            writer.writerow([
+                user.emp_id,
+                profile.full_name if profile else '',
+                user.email,
+                user.role,
+                user.department.name if user.department else '',
+                balances[user.id]
+            ])
+            writer.writerow([])
+
+            writer.writerow(['Attendance'])
+            writer.writerow(['date', 'status', 'check_in_time', 'check_out_time'])
+            while record is not None and record.user_id == user.id:
+                writer.writerow([
+                    record.date.strftime('%Y-%m-%d'),
+                    record.status,
+                    record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else '',
+                    record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else ''
+                ])
+                record = next(attendance, None)
+                if output.tell() >= EXPORT_FLUSH_BYTES:
+                    yield flush()
+            writer.writerow([])
+
+            writer.writerow(['Leave Requests'])
+            writer.writerow(['start_date', 'end_date', 'reason', 'status', 'working_days'])
+            for leave in leaves[user.id]:
+                writer.writerow([
+                    leave.start_date.strftime('%Y-%m-%d'),
+                    leave.end_date.strftime('%Y-%m-%d'),
+                    leave.reason,
+                    leave.status,
+                    calendar.business_days(leave.start_date, leave.end_date)
+                ])
+            output.write(separator)
+            if output.tell() >= EXPORT_FLUSH_BYTES:
+                yield flush()
+
+    remainder = flush()
+    if remainder:
+        yield remainder
+
+
+def generate_employee_csv(user):
+    """CSV report for a single user"""
+    return ''.join(iter_employee_csv([user.id], separator=''))
+
+
+def iter_employee_snapshots(user_ids=None, department_id=None, on_batch=None):
+    """Yield plain-data snapshots of each selected employee's report.
+
+    Snapshots hold only strings and numbers so they can be handed to
+    worker processes, which then render without touching the database.
+    """
+    year = datetime.utcnow().year
+    calendar = get_business_calendar()
+    for batch in iter_user_batches(user_ids, department_id, EXPORT_PDF_USER_BATCH, on_batch):
+        ids = [user.id for user in batch]
+        balances = leave_balances_for(ids, year)
+        leaves = fetch_leaves(ids)
+        attendance = defaultdict(list)
+        for record in stream_attendance(ids):
+            attendance[record.user_id].append((
+                record.date.strftime('%Y-%m-%d'),
+                record.status,
+                str(record.check_in_time or ''),
+                str(record.check_out_time or '')
+            ))
+
+        for user in batch:
+            profile = user.profile
+            yield {
+                "emp_id": user.emp_id,
+                "full_name": profile.full_name if profile else '',
+                "email": user.email,
+                "role": user.role,
+                "department": user.department.name if user.department else '',
+                "leave_balance": balances[user.id],
+                "attendance": attendance.pop(user.id, []),
+                "leaves": [
+                    (leave.start_date.strftime('%Y-%m-%d'), leave.end_date.strftime('%Y-%m-%d'), leave.reason,
+                     leave.status, calendar.business_days(leave.start_date, leave.end_date))
+                    for leave in leaves[user.id]
+                ],
+            }
+
+
+def render_employee_pdf(snapshot):
+    """Render an employee snapshot to PDF bytes"""
+    # reportlab is only needed here; importing it lazily keeps it out of
+    # every worker that never renders a PDF
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    # invariant output: identical data renders to identical bytes, which the
+    # report cache relies on for its strong ETags
+    p = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    width, height = letter
+    y = height - 40
+
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(40, y, "Employee Details")
+    y -= 20
+    p.setFont("Helvetica", 12)
+    p.drawString(40, y, f"ID: {snapshot['emp_id']}")
+    y -= 15
+    p.drawString(40, y, f"Name: {snapshot['full_name']}")
+    y -= 15
+    p.drawString(40, y, f"Email: {snapshot['email']}")
+    y -= 15
+    p.drawString(40, y, f"Role: {snapshot['role']}")
+    y -= 15
+    p.drawString(40, y, f"Department: {snapshot['department']}")
+    y -= 15
+    p.drawString(40, y, f"Leave Balance: {snapshot['leave_balance']}")
+    y -= 30
+
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(40, y, "Attendance")
+    y -= 20
+    p.setFont("Helvetica", 10)
+    for day, status, check_in_time, check_out_time in snapshot['attendance']:
+        p.drawString(40, y, f"{day}, {status}, {check_in_time}, {check_out_time}")
+        y -= 12
+        if y < 60:
+            p.showPage()
+            y = height - 40
+
+    y -= 20
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(40, y, "Leave Requests")
+    y -= 20
+    p.setFont("Helvetica", 10)
+    for start_date, end_date, reason, status, working_days in snapshot['leaves']:
+        p.drawString(40, y, f"{start_date} to {end_date} ({working_days} working days), {reason}, {status}")
+        y -= 12
+        if y < 60:
+            p.showPage()
+            y = height - 40
+
+    p.save()
+    return buffer.getvalue()
+
+
+def generate_employee_pdf(user):
+    """PDF report for a single user as a file-like buffer"""
+    snapshot = next(iter_employee_snapshots([user.id]))
+    return BytesIO(render_employee_pdf(snapshot))
+
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def pdf_pool(workers=None):
+    """Process pool shared by PDF exports, created on first use"""
+    global _pdf_pool
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # Spawned rather than forked: the parent is a threaded server
+            # holding database connections
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=workers or os.cpu_count(),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pdf_pool
+
+
+def _reset_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        _pdf_pool = None
+
+
+class _ZipStream:
+    """Write-only, unseekable sink that lets zipfile stream an archive out"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_employee_pdf_zip(user_ids=None, department_id=None, workers=None, on_batch=None):
+    """Yield a ZIP archive of per-employee PDF reports while they render.
+
+    Snapshots are rendered in a process pool; at most a few documents per
+    worker are in flight, and entries are written in user id order as soon
+    as the oldest outstanding document is ready.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    pool = pdf_pool(workers)
+    max_in_flight = 2 * (workers or os.cpu_count())
+    stream = _ZipStream()
+    pending = deque()
+    names = set()
+
+    def archive_name(emp_id):
+        name = secure_filename(emp_id) or 'employee'
+        candidate, suffix = name, 1
+        while candidate in names:
+            suffix += 1
+            candidate = f"{name}_{suffix}"
+        names.add(candidate)
+        return f"{candidate}.pdf"
+
+    try:
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for snapshot in iter_employee_snapshots(user_ids, department_id, on_batch):
+                pending.append((archive_name(snapshot['emp_id']), pool.submit(render_employee_pdf, snapshot)))
+                while pending and (len(pending) >= max_in_flight or pending[0][1].done()):
+                    name, future = pending.popleft()
+                    archive.writestr(name, future.result())
+                    yield stream.drain()
+            while pending:
+                name, future = pending.popleft()
+                archive.writestr(name, future.result())
+                yield stream.drain()
+        yield stream.drain()
+    except BrokenProcessPool:
+        _reset_pdf_pool()
+        raise
+    finally:
+        for _, future in pending:
+            future.cancel()
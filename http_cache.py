@@ -0,0 +1,66 @@
+"""Conditional responses for read-heavy JSON endpoints."""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select
+
+from cache import TTLCache, app_singleton
+from models import db, DataVersion, User
+
+
+def _response_cache():
+    return app_singleton('http_cache', lambda: TTLCache(
+        maxsize=current_app.config['HTTP_CACHE_SIZE'], ttl=current_app.config['HTTP_CACHE_TTL']
+    ))
+
+
+def _stamp(user_id, scopes):
+    columns = [
+        select(DataVersion.version).where(DataVersion.scope == scope).scalar_subquery()
+        for scope in scopes
+    ]
+    if user_id is not None:
+        columns.append(select(User.data_version).where(User.id == user_id).scalar_subquery())
+    if not columns:
+        return ()
+    return tuple(db.session.execute(select(*columns)).one())
+
+
+def cached_response(scopes=(), per_user=False):
+    """Serve a GET view with an ETag derived from the data versions it depends on.
+
+    `scopes` are DataVersion scopes the response reads; with `per_user` the
+    response is specific to the JWT identity and also depends on its
+    ``data_version``. Must be applied inside the JWT/role decorator.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            user_id = int(get_jwt_identity()) if per_user else None
+            # The year is part of the stamp because balances are per calendar year
+            raw = repr((request.endpoint, sorted(kwargs.items()), request.query_string, user_id,
+                        _stamp(user_id, scopes), datetime.utcnow().year))
+            etag = hashlib.sha256(raw.encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                cache = _response_cache()
+                cached = cache.get(etag)
+                if cached is None:
+                    response = current_app.make_response(f(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    cache.set(etag, (response.get_data(), response.mimetype))
+                else:
+                    body, mimetype = cached
+                    response = Response(body, mimetype=mimetype)
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,38 @@
+"""Request handling shared by the admin and manager bulk leave endpoints."""
+from flask import jsonify, request
+
+from models import db, transition_leave_requests
+
+# Most leave requests accepted by one bulk call
+BULK_LEAVE_MAX = 1000
+
+
+def bulk_transition(old_status, allowed_statuses, manager_id=None):
+    """Apply a ``{"ids": [...], "status": ...}`` body to requests in `old_status`"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    status = data.get('status')
+
+    if status not in allowed_statuses:
+        return jsonify({"error": f"Status must be one of: {', '.join(allowed_statuses)}"}), 400
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({"error": "ids must be a non-empty list of leave request ids"}), 400
+    if len(ids) > BULK_LEAVE_MAX:
+        return jsonify({"error": f"At most {BULK_LEAVE_MAX} ids per request"}), 400
+
+    try:
+        outcomes = transition_leave_requests(ids, old_status, status, manager_id=manager_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    results = []
+    for leave_id in dict.fromkeys(ids):
+        result, current_status = outcomes[leave_id]
+        results.append({"id": leave_id, "result": result, "status": current_status})
+    return jsonify({
+        "message": "Leave requests processed",
+        "updated": sum(1 for result in results if result["result"] == "updated"),
+        "results": results
+    }), 200
@@ -0,0 +1,266 @@
+"""Versioned schema migrations."""
+import logging
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError
+from business_days import BusinessCalendar
+from models import (db, AttendanceMonthly, DataVersion, Holiday, LeaveLedger, LeaveRequest, ACTIVE_LEAVE_STATUSES,
+                    compute_attendance_rollup, ledger_totals)
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+# Arbitrary key for the Postgres advisory lock serialising concurrent upgrades
+_ADVISORY_LOCK_KEY = 72_110_301
+
+
+def migration(version, description):
+    """Register a migration function taking an open connection"""
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def _lock(conn):
+    if conn.dialect.name == 'postgresql':
+        # Backfills and dedupes on large tables may run longer than DB_STATEMENT_TIMEOUT_MS
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+
+
+def current_version(conn):
+    _ensure_version_table(conn)
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def latest_version():
+    return max((version for version, _, _ in MIGRATIONS), default=0)
+
+
+def upgrade(engine=None):
+    """Create missing tables, then apply pending migrations in order, each in
+    its own transaction.
+
+    Returns the list of (version, description) pairs that were applied.
+    """
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        _lock(conn)
+        db.metadata.create_all(conn)
+
+    applied = []
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        with engine.begin() as conn:
+            _lock(conn)
+            if current_version(conn) >= version:
+                continue
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.utcnow()}
+            )
+        applied.append((version, description))
+    return applied
+
+
+def ensure_schema(engine=None):
+    """Upgrade the schema if it is behind the code; returns True if it did"""
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        version = current_version(conn)
+    if version >= latest_version():
+        return False
+    if not current_app.config['SCHEMA_AUTO_UPGRADE']:
+        logger.warning("Database schema is at version %s, code expects %s; run 'flask upgrade-db'",
+                       version, latest_version())
+        return False
+    for applied_version, description in upgrade(engine):
+        logger.info("Applied migration %s: %s", applied_version, description)
+    return True
+
+
+def _constraint_exists(conn, name):
+    return conn.execute(
+        text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": name}
+    ).first() is not None
+
+
+def _column_exists(conn, table, column):
+    if conn.dialect.name == 'postgresql':
+        return conn.execute(
+            text("SELECT 1 FROM information_schema.columns WHERE table_name = :t AND column_name = :c"),
+            {"t": table, "c": column}
+        ).first() is not None
+    return any(row[1] == column for row in conn.execute(text(f'PRAGMA table_info("{table}")')))
+
+
+def _require_extension(conn, name):
+    if conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = :name"), {"name": name}).first():
+        return
+    try:
+        conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {name}"))
+    except DBAPIError as e:
+        raise RuntimeError(
+            f"The Postgres extension '{name}' is required and this database role cannot create it. "
+            f"Run 'CREATE EXTENSION {name};' as a privileged user, then 'flask upgrade-db'."
+        ) from e
+
+
+def _sqlite_unique_index_exists(conn, table, columns):
+    for row in conn.execute(text(f'PRAGMA index_list("{table}")')):
+        name, unique = row[1], row[2]
+        if unique and tuple(info[2] for info in conn.execute(text(f'PRAGMA index_info("{name}")'))) == columns:
+            return True
+    return False
+
+
+@migration(1, 'indexes for hot query paths and one attendance row per user and day')
+def _hot_path_indexes(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_department_id ON "user" (department_id)'))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_leave_request_employee_status ON leave_request (employee_id, status)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_leave_request_pending_manager ON leave_request (employee_id, id) "
+        "WHERE status = 'pending_manager'"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_leave_request_pending_admin ON leave_request (id) "
+        "WHERE status = 'pending_admin'"
+    ))
+
+    # Keep the earliest record where a day was marked more than once
+    removed = conn.execute(text(
+        "DELETE FROM attendance WHERE id NOT IN "
+        "(SELECT MIN(id) FROM attendance GROUP BY user_id, date)"
+    )).rowcount
+    if removed:
+        logger.warning("Removed %s duplicate attendance rows (kept the earliest per user and day)", removed)
+    if conn.dialect.name == 'postgresql':
+        if not _constraint_exists(conn, 'uq_attendance_user_date'):
+            conn.execute(text(
+                "ALTER TABLE attendance ADD CONSTRAINT uq_attendance_user_date UNIQUE (user_id, date)"
+            ))
+    elif not _sqlite_unique_index_exists(conn, 'attendance', ('user_id', 'date')):
+        # create_all already builds the constraint inline on new databases
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_user_date ON attendance (user_id, date)"
+        ))
+
+
+@migration(2, 'per-user data version for report caching')
+def _user_data_version(conn):
+    if not _column_exists(conn, 'user', 'data_version'):
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0'))
+
+
+@migration(3, 'data version stamps for cached API responses')
+def _data_version_table(conn):
+    db.metadata.create_all(bind=conn, tables=[DataVersion.__table__])
+
+
+@migration(4, 'index on user.manager_id for manager queues')
+def _user_manager_index(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_manager_id ON "user" (manager_id)'))
+
+
+@migration(5, 'reject overlapping active leave requests')
+def _leave_overlap_guard(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_leave_request_employee_end ON leave_request (employee_id, end_date, start_date)"
+    ))
+    active = ", ".join(f"'{status}'" for status in ACTIVE_LEAVE_STATUSES)
+    if conn.dialect.name == 'postgresql':
+        if _constraint_exists(conn, 'ex_leave_request_overlap'):
+            return
+        overlaps = conn.execute(text(
+            f"SELECT COUNT(*) FROM leave_request a JOIN leave_request b "
+            f"ON a.employee_id = b.employee_id AND a.id < b.id "
+            f"AND a.start_date <= b.end_date AND a.end_date >= b.start_date "
+            f"WHERE a.status IN ({active}) AND b.status IN ({active})"
+        )).scalar()
+        if overlaps:
+            # The constraint cannot be added over existing violations; submissions
+            # are still checked by the application
+            logger.warning("Skipping leave overlap constraint: %s overlapping active requests exist", overlaps)
+            return
+        _require_extension(conn, 'btree_gist')
+        conn.execute(text(
+            f"ALTER TABLE leave_request ADD CONSTRAINT ex_leave_request_overlap EXCLUDE USING gist "
+            f"(employee_id WITH =, daterange(start_date, end_date, '[]') WITH &&) "
+            f"WHERE (status IN ({active}))"
+        ))
+    else:
+        overlap_check = (
+            f"SELECT RAISE(ABORT, 'leave_request_overlap') WHERE NEW.status IN ({active}) AND EXISTS ("
+            f"SELECT 1 FROM leave_request WHERE employee_id = NEW.employee_id AND id IS NOT NEW.id "
+            f"AND end_date >= NEW.start_date AND start_date <= NEW.end_date AND status IN ({active}))"
+        )
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS tr_leave_request_overlap_insert BEFORE INSERT ON leave_request "
+            f"BEGIN {overlap_check}; END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS tr_leave_request_overlap_update "
+            f"BEFORE UPDATE OF employee_id, start_date, end_date ON leave_request "
+            f"BEGIN {overlap_check}; END"
+        ))
+
+
+@migration(6, 'partial index on absence attendance rows for availability')
+def _attendance_absence_index(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_attendance_absences ON attendance (user_id, date) "
+        "WHERE status IN ('absent', 'leave')"
+    ))
+
+
+@migration(7, 'holiday calendar; leave ledger recounted in working days')
+def _holiday_calendar(conn):
+    db.metadata.create_all(bind=conn, tables=[Holiday.__table__])
+    holidays = [day for day, in conn.execute(select(Holiday.date))]
+    leaves = conn.execute(
+        select(LeaveRequest.employee_id, LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.status)
+        .where(LeaveRequest.status.in_(ACTIVE_LEAVE_STATUSES))
+    )
+    totals = ledger_totals(leaves, BusinessCalendar(holidays))
+    conn.execute(LeaveLedger.__table__.delete())
+    if totals:
+        conn.execute(LeaveLedger.__table__.insert(), [
+            {"user_id": user_id, "year": year, "days_taken": taken, "days_pending": pending}
+            for (user_id, year), (taken, pending) in totals.items()
+        ])
+
+
+@migration(8, 'monthly attendance rollup')
+def _attendance_monthly(conn):
+    db.metadata.create_all(bind=conn, tables=[AttendanceMonthly.__table__])
+    rollup = compute_attendance_rollup(conn)
+    conn.execute(AttendanceMonthly.__table__.delete())
+    if rollup:
+        conn.execute(AttendanceMonthly.__table__.insert(), [
+            {"user_id": user_id, "month": month, "present": present, "absent": absent, "leave": leave}
+            for (user_id, month), (present, absent, leave) in rollup.items()
+        ])
+
+
+@migration(9, 'revocation timestamps for overlapping sync')
+def _revoked_token_timestamp(conn):
+    if not _column_exists(conn, 'revoked_token', 'revoked_at'):
+        # Workers load every existing row when they rebuild, so its exact time is not needed
+        conn.execute(text(
+            "ALTER TABLE revoked_token ADD COLUMN revoked_at TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00'"
+        ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_revoked_token_revoked_at ON revoked_token (revoked_at)"))
@@ -1,9 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash
+from database import RoutingSession
+from passwords import hash_password
 from flask_login import UserMixin
-from datetime import datetime
+from sqlalchemy import and_, case, event, func, inspect, or_, select, update
+from sqlalchemy.orm import Session
+from datetime import datetime, date
+from collections import defaultdict
+from itertools import chain
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+ANNUAL_LEAVE_DAYS = 20
+PENDING_LEAVE_STATUSES = ('pending_manager', 'pending_admin')
+# Leave that holds its dates: another request may not overlap it
+ACTIVE_LEAVE_STATUSES = ('approved',) + PENDING_LEAVE_STATUSES
+ATTENDANCE_STATUSES = ('present', 'absent', 'leave')
 
-db = SQLAlchemy()
 
 #could add timestampMixin for automatic timestamping of created_at and updated_at fields
 class User(db.Model, UserMixin):
@@ -13,8 +25,10 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='employee')  
-    department_id = db.Column(db.Integer, db.ForeignKey('department.id'), nullable=True)
-    manager_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) 
+    department_id = db.Column(db.Integer, db.ForeignKey('department.id'), nullable=True, index=True)
+    manager_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    # Bumped whenever data shown in this user's reports changes; see _bump_data_versions
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     # leave_balance = db.Column(db.Integer, nullable=False, default=20)
     
     profile = db.relationship('EmployeeProfile', backref='user', uselist=False, cascade='all, delete-orphan')
@@ -24,17 +38,13 @@ class User(db.Model, UserMixin):
     
     def set_password(self, password):
         """Hash and set the password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def leave_balance(self, year = None):
         """Calculate leave balance for the user"""
-        approved_leaves = LeaveRequest.query.filter_by(employee_id=self.id, status='approved').all()
-        days_taken = sum(
-            (lr.end_date - lr.start_date).days + 1
-            for lr in approved_leaves
-            if lr.start_date.year == year
-        )
-        return 20 - days_taken
+        if year is None:
+            year = datetime.utcnow().year
+        return leave_balances_for([self.id], year)[self.id]
     
     def __repr__(self):
         return f'<User {self.emp_id}>'
@@ -65,6 +75,16 @@ class Department(db.Model):
         return f'<Department {self.name}>'
 
 
+class Holiday(db.Model):
+    """Public holiday; not charged as a leave day"""
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self):
+        return f'<Holiday {self.date} - {self.name}>'
+
+
 class LeaveRequest(db.Model):
     """Leave request model"""
     id = db.Column(db.Integer, primary_key=True)
@@ -74,6 +94,20 @@ class LeaveRequest(db.Model):
     reason = db.Column(db.Text, nullable=True)
     status = db.Column(db.String(20), nullable=False, default='pending_manager')  # 'pending', 'approved', 'rejected'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_leave_request_employee_status', 'employee_id', 'status'),
+        # Approval queues only ever look at a small slice of the table
+        db.Index('ix_leave_request_pending_manager', 'employee_id', 'id',
+                 postgresql_where=db.text("status = 'pending_manager'"),
+                 sqlite_where=db.text("status = 'pending_manager'")),
+        db.Index('ix_leave_request_pending_admin', 'id',
+                 postgresql_where=db.text("status = 'pending_admin'"),
+                 sqlite_where=db.text("status = 'pending_admin'")),
+        # Overlap checks: new leave is almost always in the future, so seeking on
+        # end_date skips an employee's past requests however many there are
+        db.Index('ix_leave_request_employee_end', 'employee_id', 'end_date', 'start_date'),
+    )
     
     def __repr__(self):
         return f'<LeaveRequest {self.id} - {self.status}>'
@@ -81,11 +115,551 @@ class LeaveRequest(db.Model):
 class Attendance(db.Model):
     """Attendance model"""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    status = db.Column(db.String(20), nullable=False, default='present')  # 'present', 'absent', 'leave'
+    # active_history: the old values are needed to move counts in the monthly rollup
+    user_id = db.column_property(db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False), active_history=True)
+    date = db.column_property(db.Column(db.Date, nullable=False), active_history=True)
+    status = db.column_property(db.Column(db.String(20), nullable=False, default='present'),  # 'present', 'absent', 'leave'
+                                active_history=True)
     check_in_time = db.Column(db.Time, nullable=True)
     check_out_time = db.Column(db.Time, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='uq_attendance_user_date'),
+        # Availability only looks at the few days people were out
+        db.Index('ix_attendance_absences', 'user_id', 'date',
+                 postgresql_where=db.text("status IN ('absent', 'leave')"),
+                 sqlite_where=db.text("status IN ('absent', 'leave')")),
+    )
     
     def __repr__(self):
-        return f'<Attendance {self.user_id} - {self.date} - {self.status}>'
\ No newline at end of file
+        return f'<Attendance {self.user_id} - {self.date} - {self.status}>'
+
+
+class AttendanceMonthly(db.Model):
+    """Attendance counts per user and month, kept in step with attendance writes"""
+    __tablename__ = 'attendance_monthly'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    leave = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_attendance_monthly_month', 'month'),
+    )
+
+    @classmethod
+    def apply(cls, deltas, connection=None):
+        """Add {(user_id, month): {status: count}} deltas with a single upsert"""
+        rows = [
+            {"user_id": user_id, "month": month, **{status: counts.get(status, 0) for status in ATTENDANCE_STATUSES}}
+            for (user_id, month), counts in deltas.items()
+            if any(counts.values())
+        ]
+        if not rows:
+            return
+        table = cls.__table__
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'month'],
+            set_={status: table.c[status] + stmt.excluded[status] for status in ATTENDANCE_STATUSES}
+        )
+        (connection or db.session).execute(stmt, rows)
+
+    @classmethod
+    def refresh(cls, keys, connection=None):
+        """Recount the (user_id, month) rows in `keys` from attendance with one INSERT ... SELECT"""
+        users_by_month = defaultdict(set)
+        for user_id, month in keys:
+            users_by_month[month].add(user_id)
+        if not users_by_month:
+            return
+        if db.engine.dialect.name == 'postgresql':
+            # Inline literals so the select and GROUP BY expressions are identical
+            month = db.cast(func.date_trunc(db.literal_column("'month'"), Attendance.date), db.Date)
+        else:
+            month = func.date(Attendance.date, db.literal_column("'start of month'"))
+        counts = select(
+            Attendance.user_id, month,
+            *(func.sum(case((Attendance.status == status, 1), else_=0)) for status in ATTENDANCE_STATUSES)
+        ).where(or_(*(
+            and_(Attendance.user_id.in_(user_ids), Attendance.date >= first, Attendance.date < next_month(first))
+            for first, user_ids in users_by_month.items()
+        ))).group_by(Attendance.user_id, month)
+
+        table = cls.__table__
+        stmt = dialect_insert(table).from_select(['user_id', 'month', *ATTENDANCE_STATUSES], counts)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'month'],
+            set_={status: stmt.excluded[status] for status in ATTENDANCE_STATUSES}
+        )
+        (connection or db.session).execute(stmt)
+
+    def __repr__(self):
+        return f'<AttendanceMonthly {self.user_id} - {self.month}>'
+
+
+class LeaveLedger(db.Model):
+    """Materialized leave totals per user and year, kept in step with leave request status changes"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    days_taken = db.Column(db.Integer, nullable=False, default=0)
+    days_pending = db.Column(db.Integer, nullable=False, default=0)
+
+    @property
+    def balance(self):
+        return ANNUAL_LEAVE_DAYS - self.days_taken
+
+    @classmethod
+    def balance_for(cls, user_id, year):
+        """Leave balance for one user and year with a primary key lookup"""
+        entry = db.session.get(cls, (user_id, year))
+        return entry.balance if entry else ANNUAL_LEAVE_DAYS
+
+    @classmethod
+    def record_transition(cls, leave, old_status, new_status):
+        """Adjust the ledger for a leave request moving from old_status to new_status.
+
+        Must be called in the same transaction as the status change; pass
+        None as old_status for a newly submitted request.
+        """
+        cls.record_transitions([(leave.employee_id, leave.start_date, leave.end_date)], old_status, new_status)
+
+    @classmethod
+    def record_transitions(cls, leaves, old_status, new_status):
+        """Like record_transition for many (employee_id, start_date, end_date) rows, in one upsert"""
+        from business_days import get_business_calendar
+
+        # Writes always charge against the current holiday list
+        calendar = get_business_calendar(max_age=0)
+        taken, pending = _ledger_weight(new_status)
+        old_taken, old_pending = _ledger_weight(old_status)
+        deltas = defaultdict(lambda: (0, 0))
+        for employee_id, start_date, end_date in leaves:
+            days = calendar.business_days(start_date, end_date)
+            total_taken, total_pending = deltas[(employee_id, start_date.year)]
+            deltas[(employee_id, start_date.year)] = (
+                total_taken + (taken - old_taken) * days, total_pending + (pending - old_pending) * days
+            )
+        cls.apply(deltas)
+
+    @classmethod
+    def apply(cls, deltas):
+        """Add {(user_id, year): (days_taken, days_pending)} deltas with a single upsert"""
+        rows = [
+            {"user_id": user_id, "year": year, "days_taken": taken, "days_pending": pending}
+            for (user_id, year), (taken, pending) in deltas.items()
+            if taken or pending
+        ]
+        if not rows:
+            return
+        stmt = dialect_insert(cls)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'year'],
+            set_={
+                "days_taken": cls.days_taken + stmt.excluded.days_taken,
+                "days_pending": cls.days_pending + stmt.excluded.days_pending,
+            }
+        )
+        db.session.execute(stmt, rows)
+
+    def __repr__(self):
+        return f'<LeaveLedger {self.user_id} - {self.year}>'
+
+
+
+class ExportJob(db.Model):
+    """Report export queued for a background worker"""
+    id = db.Column(db.Integer, primary_key=True)
+    format = db.Column(db.String(10), nullable=False)  # 'csv', 'pdf', 'zip'
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    file_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    requested_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_export_job_status_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<ExportJob {self.id} - {self.format} - {self.status}>'
+
+
+class RevokedToken(db.Model):
+    """Revoked JWT ids, kept until the token would have expired anyway"""
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    # Workers pick up new revocations by this timestamp, with an overlap window
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    # Ids of purged rows are never reused
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
+
+
+class DataVersion(db.Model):
+    """Change counter per data scope, used to stamp cached API responses"""
+    scope = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DataVersion {self.scope} - {self.version}>'
+
+
+def _ledger_weight(status):
+    """(taken, pending) multipliers a leave request in `status` contributes to the ledger"""
+    if status == 'approved':
+        return 1, 0
+    if status in PENDING_LEAVE_STATUSES:
+        return 0, 1
+    return 0, 0
+
+
+def ledger_totals(leaves, calendar):
+    """Sum (employee_id, start_date, end_date, status) rows into ledger totals.
+
+    Returns {(user_id, year): (days_taken, days_pending)}; leave is charged
+    to the year it starts in.
+    """
+    totals = defaultdict(lambda: (0, 0))
+    for employee_id, start_date, end_date, status in leaves:
+        taken, pending = _ledger_weight(status)
+        if not (taken or pending):
+            continue
+        days = calendar.business_days(start_date, end_date)
+        total_taken, total_pending = totals[(employee_id, start_date.year)]
+        totals[(employee_id, start_date.year)] = (total_taken + taken * days, total_pending + pending * days)
+    return dict(totals)
+
+
+def dialect_insert(target):
+    """INSERT construct for a model or table supporting ON CONFLICT on the primary engine's dialect"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(target)
+
+
+def overlapping_leave_ids(employee_id, start_date, end_date):
+    """Ids of the employee's approved or pending requests overlapping the inclusive range"""
+    return [leave_id for leave_id, in db.session.query(LeaveRequest.id).filter(
+        LeaveRequest.employee_id == employee_id,
+        LeaveRequest.end_date >= start_date,
+        LeaveRequest.start_date <= end_date,
+        LeaveRequest.status.in_(ACTIVE_LEAVE_STATUSES),
+    ).order_by(LeaveRequest.id)]
+
+
+def leave_balances_for(user_ids, year):
+    """Leave balances for many users with a single query over the ledger.
+
+    Returns a dict of user id -> remaining days for `year`. Pass `None` as
+    `user_ids` to read every user; users without ledger entries then fall
+    back to the full allowance on lookup. The ledger already counts working
+    days and changes in the same transaction as leave and holiday updates,
+    so the result always matches the versions cached responses are stamped
+    with.
+    """
+    query = db.session.query(LeaveLedger.user_id, LeaveLedger.days_taken).filter(LeaveLedger.year == year)
+    if user_ids is None:
+        balances = defaultdict(lambda: ANNUAL_LEAVE_DAYS)
+    else:
+        user_ids = list(user_ids)
+        balances = dict.fromkeys(user_ids, ANNUAL_LEAVE_DAYS)
+        if not user_ids:
+            return balances
+        query = query.filter(LeaveLedger.user_id.in_(user_ids))
+
+    for user_id, taken in query:
+        balances[user_id] = ANNUAL_LEAVE_DAYS - taken
+    return balances
+
+
+def department_stats(day):
+    """Per-department headcount, average salary, people on leave and attendance on `day`.
+
+    Each figure is aggregated per department in a subquery and the results
+    are joined onto the department list, so this is a single query.
+    """
+    staff = db.session.query(
+        User.department_id.label('department_id'),
+        func.count(User.id).label('headcount'),
+        func.avg(EmployeeProfile.salary).label('average_salary'),
+    ).outerjoin(EmployeeProfile, EmployeeProfile.user_id == User.id).group_by(User.department_id).subquery()
+    on_leave = db.session.query(
+        User.department_id.label('department_id'),
+        func.count(func.distinct(LeaveRequest.employee_id)).label('on_leave'),
+    ).join(User, User.id == LeaveRequest.employee_id).filter(
+        LeaveRequest.status == 'approved',
+        LeaveRequest.start_date <= day,
+        LeaveRequest.end_date >= day,
+    ).group_by(User.department_id).subquery()
+    present = db.session.query(
+        User.department_id.label('department_id'),
+        func.count(Attendance.id).label('present'),
+    ).join(User, User.id == Attendance.user_id).filter(
+        Attendance.date == day,
+        Attendance.status == 'present',
+    ).group_by(User.department_id).subquery()
+
+    return db.session.query(
+        Department.id,
+        Department.name,
+        func.coalesce(staff.c.headcount, 0),
+        staff.c.average_salary,
+        func.coalesce(on_leave.c.on_leave, 0),
+        func.coalesce(present.c.present, 0),
+    ).outerjoin(staff, staff.c.department_id == Department.id) \
+        .outerjoin(on_leave, on_leave.c.department_id == Department.id) \
+        .outerjoin(present, present.c.department_id == Department.id) \
+        .order_by(Department.id).all()
+
+
+def compute_leave_ledger(year=None):
+    """Recompute ledger totals from leave history.
+
+    Returns {(user_id, year): (days_taken, days_pending)}, optionally
+    restricted to a single year.
+    """
+    from business_days import get_business_calendar
+
+    query = db.session.query(
+        LeaveRequest.employee_id, LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.status
+    ).filter(LeaveRequest.status.in_(ACTIVE_LEAVE_STATUSES))
+    if year is not None:
+        query = query.filter(
+            LeaveRequest.start_date >= date(year, 1, 1),
+            LeaveRequest.start_date < date(year + 1, 1, 1),
+        )
+    return ledger_totals(query, get_business_calendar(max_age=0))
+
+
+def rebuild_leave_ledger_years(years):
+    """Bring the stored ledger for `years` back in line with leave history.
+
+    Used when the holiday calendar changes. Only entries that differ are
+    rewritten; their users' report versions and the leave scope are bumped.
+    Returns the ids of the affected users.
+    """
+    changed = set()
+    for year in years:
+        live = compute_leave_ledger(year)
+        stored = {
+            (entry.user_id, entry.year): (entry.days_taken, entry.days_pending)
+            for entry in LeaveLedger.query.filter_by(year=year)
+        }
+        deltas = {}
+        for key in set(live) | set(stored):
+            taken, pending = live.get(key, (0, 0))
+            stored_taken, stored_pending = stored.get(key, (0, 0))
+            if (taken, pending) != (stored_taken, stored_pending):
+                deltas[key] = (taken - stored_taken, pending - stored_pending)
+        LeaveLedger.apply(deltas)
+        changed.update(user_id for user_id, _ in deltas)
+    bump_data_versions(changed)
+    if changed:
+        bump_scope_versions(['leave'])
+    return changed
+
+
+def transition_leave_requests(ids, old_status, new_status, manager_id=None):
+    """Move every request in `ids` that is still in `old_status` to `new_status`.
+
+    A single UPDATE guarded by the current status, so a request changed
+    concurrently is left alone rather than overwritten. With `manager_id`
+    only requests of that manager's direct reports are touched. The ledger,
+    report versions and cache scopes are updated in the same transaction.
+
+    Returns {id: (result, status)} where result is 'updated', 'conflict'
+    (the request is in another status), 'forbidden' or 'not_found', and
+    status is the request's status afterwards when the caller may see it.
+    """
+    ids = set(ids)
+    table = LeaveRequest.__table__
+    stmt = update(table).where(table.c.id.in_(ids), table.c.status == old_status)
+    if manager_id is not None:
+        stmt = stmt.where(table.c.employee_id.in_(
+            db.session.query(User.id).filter(User.manager_id == manager_id).scalar_subquery()
+        ))
+    updated = db.session.execute(
+        stmt.values(status=new_status).returning(table.c.id, table.c.employee_id, table.c.start_date, table.c.end_date)
+    ).all()
+
+    LeaveLedger.record_transitions([row[1:] for row in updated], old_status, new_status)
+    bump_data_versions({employee_id for _, employee_id, _, _ in updated})
+    if updated:
+        bump_scope_versions(['leave'])
+
+    outcomes = {leave_id: ('updated', new_status) for leave_id, _, _, _ in updated}
+    remaining = ids - outcomes.keys()
+    if remaining:
+        rows = db.session.query(LeaveRequest.id, LeaveRequest.status, User.manager_id) \
+            .join(User, User.id == LeaveRequest.employee_id).filter(LeaveRequest.id.in_(remaining))
+        for leave_id, status, employee_manager_id in rows:
+            if manager_id is not None and employee_manager_id != manager_id:
+                outcomes[leave_id] = ('forbidden', None)
+            else:
+                outcomes[leave_id] = ('conflict', status)
+    for leave_id in remaining - outcomes.keys():
+        outcomes[leave_id] = ('not_found', None)
+    return outcomes
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1, day=1)
+
+
+# Advisory lock namespace for rollup maintenance (two-key form: namespace, user id)
+_ROLLUP_LOCK_KEY = 72_110_302
+
+
+def lock_attendance_rollup(user_ids, connection=None):
+    """Serialise rollup maintenance for `user_ids` until the transaction ends.
+
+    Bulk writes recount whole months while single writes apply deltas, so
+    writers touching the same user take turns. Only needed on Postgres;
+    SQLite already allows a single writer. Locks are taken in id order so
+    concurrent writers cannot deadlock.
+    """
+    if not user_ids or db.engine.dialect.name != 'postgresql':
+        return
+    (connection or db.session).execute(
+        db.text("SELECT pg_advisory_xact_lock(:key, u) FROM unnest(CAST(:ids AS integer[])) AS u ORDER BY u"),
+        {"key": _ROLLUP_LOCK_KEY, "ids": sorted(user_ids)}
+    )
+
+
+def attendance_rollup_deltas(changes):
+    """Turn (user_id, day, status, +1/-1) changes into AttendanceMonthly deltas"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for user_id, day, status, sign in changes:
+        if status in ATTENDANCE_STATUSES:
+            deltas[(user_id, month_start(day))][status] += sign
+    return deltas
+
+
+def compute_attendance_rollup(connection=None):
+    """Recount AttendanceMonthly rows from raw attendance: {(user_id, month): (present, absent, leave)}"""
+    year = func.extract('year', Attendance.date)
+    month = func.extract('month', Attendance.date)
+    rows = (connection or db.session).execute(
+        select(
+            Attendance.user_id, year, month,
+            *(func.sum(case((Attendance.status == status, 1), else_=0)) for status in ATTENDANCE_STATUSES)
+        ).group_by(Attendance.user_id, year, month)
+    )
+    return {
+        (user_id, date(int(row_year), int(row_month), 1)): tuple(int(count or 0) for count in counts)
+        for user_id, row_year, row_month, *counts in rows
+    }
+
+
+def bump_data_versions(user_ids, connection=None):
+    """Mark the reports of `user_ids` as changed.
+
+    ORM changes are picked up automatically on flush; call this after
+    writing Attendance, LeaveRequest or EmployeeProfile rows with Core
+    statements.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    (connection or db.session).execute(
+        update(User.__table__)
+        .where(User.__table__.c.id.in_(user_ids))
+        .values(data_version=User.__table__.c.data_version + 1)
+    )
+
+
+def bump_scope_versions(scopes, connection=None):
+    """Mark every cached response depending on `scopes` as stale.
+
+    ORM changes are picked up automatically on flush; call this after
+    writing Department, User or LeaveRequest rows with Core statements.
+    """
+    scopes = sorted(set(scopes))
+    if not scopes:
+        return
+    table = DataVersion.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(index_elements=['scope'], set_={"version": table.c.version + 1})
+    (connection or db.session).execute(stmt, [{"scope": scope, "version": 1} for scope in scopes])
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_data_versions(session, flush_context):
+    user_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Attendance, EmployeeProfile)):
+            user_ids.add(obj.user_id)
+        elif isinstance(obj, LeaveRequest):
+            user_ids.add(obj.employee_id)
+        elif isinstance(obj, User) and obj not in session.new and session.is_modified(obj, include_collections=False):
+            user_ids.add(obj.id)
+    user_ids.discard(None)
+    bump_data_versions(user_ids, session.connection())
+
+
+# Scope bumped when rows of a model change; see bump_scope_versions
+_SCOPES = ((Department, 'departments'), (User, 'users'), (LeaveRequest, 'leave'), (Holiday, 'holidays'))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_scope_versions(session, flush_context):
+    scopes = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        for model, scope in _SCOPES:
+            if isinstance(obj, model) and (obj not in session.dirty
+                                           or session.is_modified(obj, include_collections=False)):
+                scopes.add(scope)
+    bump_scope_versions(scopes, session.connection())
+
+
+@event.listens_for(Session, 'after_flush')
+def _roll_up_attendance(session, flush_context):
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Attendance):
+            changes.append((obj.user_id, obj.date, obj.status, 1))
+    for obj in session.deleted:
+        if isinstance(obj, Attendance):
+            # Report what was stored, not any unflushed edits made before the delete
+            state = inspect(obj)
+            changes.append((obj.user_id, _committed(state, 'date'), _committed(state, 'status'), -1))
+    for obj in session.dirty:
+        if isinstance(obj, Attendance) and obj not in session.deleted:
+            state = inspect(obj)
+            old = (_committed(state, 'user_id'), _committed(state, 'date'), _committed(state, 'status'))
+            new = (obj.user_id, obj.date, obj.status)
+            if old != new:
+                changes.append(old + (-1,))
+                changes.append(new + (1,))
+    if changes:
+        connection = session.connection()
+        lock_attendance_rollup({user_id for user_id, _, _, _ in changes}, connection)
+        AttendanceMonthly.apply(attendance_rollup_deltas(changes), connection)
+
+
+def _committed(state, key):
+    """Value of an attribute as it was before the flush"""
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), key)
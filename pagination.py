@@ -0,0 +1,51 @@
+"""Opaque cursors for keyset pagination."""
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(**position):
+    raw = json.dumps(position, separators=(',', ':'), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor; raises ValueError if it is malformed"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def keyset_page(query, id_column, cursor, limit, row_id=lambda row: row.id):
+    """One page of `query` in `id_column` order, after the position in `cursor`.
+
+    Returns (rows, next_cursor), next_cursor being None on the last page.
+    Raises ValueError if the cursor is malformed.
+    """
+    query = query.order_by(id_column)
+    if cursor:
+        try:
+            query = query.filter(id_column > int(decode_cursor(cursor)['id']))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+    # Fetch one extra row to know whether another page follows
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(id=row_id(rows[-1]))
+
+
+def page_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Clamp a requested page size to [1, maximum]"""
+    if value is None:
+        return default
+    return max(1, min(value, maximum))
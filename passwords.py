@@ -0,0 +1,78 @@
+"""Password hashing on a bounded thread pool."""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+
+from flask import current_app, jsonify
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from cache import app_singleton
+
+
+class HashingPoolSaturated(Exception):
+    pass
+
+
+class HashingPool:
+
+    def __init__(self, workers, max_queue, timeout):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self.timeout = timeout
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolSaturated()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingPoolSaturated()
+
+
+def get_hashing_pool():
+    return app_singleton('hashing_pool', lambda: HashingPool(
+        current_app.config['PASSWORD_HASH_WORKERS'],
+        current_app.config['PASSWORD_HASH_QUEUE'],
+        current_app.config['PASSWORD_HASH_TIMEOUT']
+    ))
+
+
+@lru_cache(maxsize=None)
+def _method_parameters(method):
+    # werkzeug expands defaults (e.g. 'scrypt' -> 'scrypt:32768:8:1') in the stored hash
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def hash_password(password):
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    return get_hashing_pool().run(generate_password_hash, password, method)
+
+
+def verify_password(password_hash, password):
+    return get_hashing_pool().run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if the stored hash was made with other parameters than the configured ones"""
+    return password_hash.split('$', 1)[0] != _method_parameters(current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def init_app(app):
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+    app.config.setdefault('PASSWORD_HASH_QUEUE', 64)
+    app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+    app.config.setdefault('PASSWORD_HASH_RETRY_AFTER', 1)
+
+    @app.errorhandler(HashingPoolSaturated)
+    def hashing_pool_saturated(e):
+        response = jsonify({"error": "Server busy, please retry shortly"})
+        response.headers['Retry-After'] = str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+        return response, 503
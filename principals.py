@@ -0,0 +1,82 @@
+"""Who is making the request, from JWT claims confirmed against a per-process principal cache."""
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from flask import current_app, g, jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+
+from cache import TTLCache, app_singleton
+from models import db, DataVersion, User
+
+Principal = namedtuple('Principal', 'id emp_id role department_id')
+
+
+def principal_claims(user):
+    """Additional JWT claims describing `user`"""
+    return {"role": user.role, "emp_id": user.emp_id, "department_id": user.department_id}
+
+
+def _principal_cache():
+    return app_singleton('principal_cache', lambda: TTLCache(
+        maxsize=current_app.config['PRINCIPAL_CACHE_SIZE'], ttl=current_app.config['PRINCIPAL_CACHE_TTL']
+    ))
+
+
+_lock = threading.Lock()
+
+
+def _sync_principal_cache(cache):
+    """Drop every cached principal if a user changed, checked at most every ``PRINCIPAL_SYNC_SECONDS``"""
+    state = current_app.extensions.setdefault('principal_sync', {"version": None, "checked": 0.0})
+    now = time.monotonic()
+    if now - state["checked"] < current_app.config['PRINCIPAL_SYNC_SECONDS']:
+        return
+    version = db.session.query(DataVersion.version).filter(DataVersion.scope == 'users').scalar() or 0
+    with _lock:
+        if state["version"] != version:
+            cache.clear()
+        state["version"] = version
+        state["checked"] = now
+
+
+def load_principal(user_id):
+    cache = _principal_cache()
+    _sync_principal_cache(cache)
+    principal = cache.get(user_id)
+    if principal is None:
+        row = db.session.query(User.id, User.emp_id, User.role, User.department_id).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        principal = Principal(*row)
+        cache.set(user_id, principal)
+    return principal
+
+
+def current_principal():
+    """Principal for the current request's access token, or None if the user is gone"""
+    # Resolved once per request; the role check and the view share it
+    if 'principal' not in g:
+        g.principal = load_principal(int(get_jwt_identity()))
+    return g.principal
+
+
+def invalidate_principal(user_id):
+    _principal_cache().pop(user_id)
+
+
+def role_required(role, message):
+    def decorator(f):
+        @wraps(f)
+        @jwt_required()
+        def decorated_function(*args, **kwargs):
+            # Tokens issued before role claims existed fall through to the lookup
+            if get_jwt().get('role', role) != role:
+                return jsonify({"error": message}), 403
+            principal = current_principal()
+            if not principal or principal.role != role:
+                return jsonify({"error": message}), 403
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
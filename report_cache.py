@@ -0,0 +1,106 @@
+"""Disk cache for rendered employee reports."""
+import hashlib
+import os
+import tempfile
+import threading
+from datetime import datetime
+from io import BytesIO
+
+from flask import Response, current_app, request, send_file
+
+from business_days import get_business_calendar
+from cache import app_singleton
+
+# Bump when the CSV or PDF layout changes so stale renders are not served
+RENDERER_VERSION = 2
+
+
+class ReportCache:
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def open(self, key):
+        """Open a cached entry for reading and mark it as recently used, or return None"""
+        path = self._path(key)
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return handle
+
+    def put(self, key, data):
+        """Store an entry atomically and evict old entries if over the size limit"""
+        fd, partial = tempfile.mkstemp(dir=self.directory, prefix='.part-')
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        os.replace(partial, self._path(key))
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.startswith('.') or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def get_report_cache():
+    return app_singleton('report_cache', lambda: ReportCache(
+        current_app.config['REPORT_CACHE_DIR'], current_app.config['REPORT_CACHE_MAX_BYTES']
+    ))
+
+
+def report_key(kind, user):
+    year = datetime.utcnow().year
+    # Leave days depend on the holiday calendar as well as the user's own data
+    calendar = get_business_calendar().version
+    raw = f"{kind}:{user.id}:{user.data_version}:{year}:{calendar}:{RENDERER_VERSION}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def send_cached_report(user, kind, render, mimetype, download_name):
+    """Serve a user's report from the cache, rendering it with `render()` on a miss"""
+    key = report_key(kind, user)
+    if request.if_none_match.contains_weak(key):
+        response = Response(status=304)
+        response.set_etag(key)
+        return response
+
+    cache = get_report_cache()
+    handle = cache.open(key)
+    if handle is None:
+        data = render()
+        cache.put(key, data)
+        handle = BytesIO(data)
+
+    response = send_file(handle, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                         etag=key, conditional=False)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,128 @@
+"""Token revocation shared by every worker process."""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select
+
+from models import db, RevokedToken, dialect_insert
+
+# How often the filter is rebuilt from the live rows, dropping expired ids
+REBUILD_INTERVAL = 3600
+# How far before the newest revocation seen each sync looks again
+SYNC_LOOKBACK = timedelta(seconds=60)
+
+
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+
+    def __init__(self, sync_interval=5.0, capacity=100_000, error_rate=0.001):
+        self.sync_interval = sync_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._count = 0
+        # Newest revoked_at seen, and the ids seen within the lookback window
+        # before it so that re-reading them does not count them again
+        self._high_water = None
+        self._recent = {}
+        self._last_sync = None
+        self._last_rebuild = None
+
+    def revoke(self, jti, expires_at):
+        stmt = dialect_insert(RevokedToken.__table__).values(
+            jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow()
+        )
+        # Always on the primary, outside the request's session
+        with db.engine.begin() as conn:
+            conn.execute(stmt.on_conflict_do_nothing(index_elements=['jti']))
+        with self._lock:
+            self._bloom.add(jti)
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._bloom:
+            return False
+        with db.engine.connect() as conn:
+            return conn.execute(
+                select(RevokedToken.id).where(RevokedToken.jti == jti)
+            ).first() is not None
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._last_sync is not None and now - self._last_sync < self.sync_interval:
+            return
+        with self._lock:
+            if self._last_sync is not None and now - self._last_sync < self.sync_interval:
+                return
+            if self._last_rebuild is None or now - self._last_rebuild > REBUILD_INTERVAL or self._count > self.capacity:
+                self._rebuild()
+            else:
+                query = select(RevokedToken.jti, RevokedToken.revoked_at)
+                if self._high_water is not None:
+                    query = query.where(RevokedToken.revoked_at >= self._high_water - SYNC_LOOKBACK)
+                with db.engine.connect() as conn:
+                    rows = conn.execute(query).all()
+                self._add_rows(rows)
+            self._last_sync = now
+
+    def _rebuild(self):
+        with db.engine.begin() as conn:
+            conn.execute(delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow()))
+            rows = conn.execute(select(RevokedToken.jti, RevokedToken.revoked_at)).all()
+        # Size for twice the live rows so the filter is not saturated before the next rebuild
+        self.capacity = max(self.capacity, 2 * len(rows))
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        self._count = 0
+        self._recent = {}
+        self._add_rows(rows)
+        self._last_rebuild = time.monotonic()
+
+    def _add_rows(self, rows):
+        for jti, revoked_at in rows:
+            if jti in self._recent:
+                continue
+            self._bloom.add(jti)
+            self._count += 1
+            self._recent[jti] = revoked_at
+            if self._high_water is None or revoked_at > self._high_water:
+                self._high_water = revoked_at
+        if self._high_water is not None:
+            cutoff = self._high_water - SYNC_LOOKBACK
+            self._recent = {jti: revoked_at for jti, revoked_at in self._recent.items() if revoked_at >= cutoff}
+
+
+def get_revocation_store():
+    return current_app.extensions['revocation_store']
+
+
+def init_app(app, jwt):
+    app.extensions['revocation_store'] = RevocationStore(sync_interval=app.config['REVOCATION_SYNC_SECONDS'])
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return get_revocation_store().is_revoked(jwt_payload['jti'])
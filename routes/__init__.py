@@ -1,4 +1,5 @@
 from .auth import auth_bp
 from .admin import admin_bp
 from .employee import employee_bp
-from .manager import manager_bp
\ No newline at end of file
+from .manager import manager_bp
+from .health import health_bp
\ No newline at end of file
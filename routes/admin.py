@@ -1,61 +1,88 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import get_jwt_identity
 # from flask_login import login_required, current_user
-from models import db, User, EmployeeProfile, Department, LeaveRequest, Attendance
-from datetime import datetime
+from models import (db, User, EmployeeProfile, Department, Holiday, LeaveRequest, Attendance, AttendanceMonthly,
+                    LeaveLedger, ExportJob, ATTENDANCE_STATUSES, bump_data_versions, department_stats,
+                    dialect_insert, leave_balances_for, lock_attendance_rollup, month_start, next_month,
+                    rebuild_leave_ledger_years, transition_leave_requests)
+from datetime import datetime, time, timedelta
 
-import csv
-from io import StringIO, BytesIO
-from flask import Response, send_file
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+import json
+import os
+from flask import Response, current_app, send_file, stream_with_context, url_for
 
-from functools import wraps
+from cache import TTLCache, app_singleton
+from principals import role_required, invalidate_principal
+from database import route_reads_to_replica
+from http_cache import cached_response
+from pagination import keyset_page, page_limit
+from exports import generate_employee_csv, generate_employee_pdf, iter_employee_csv, iter_employee_pdf_zip
+import export_jobs
+from leave_actions import bulk_transition
+from availability import availability_response
+from business_days import get_business_calendar, invalidate_business_calendar
+from report_cache import send_cached_report
+
+# Rows sent to the database per bulk attendance upsert
+BULK_ATTENDANCE_BATCH = 1000
+# Rows fetched per round trip and bytes buffered per chunk when streaming responses
+ATTENDANCE_STREAM_CHUNK = 2000
+STREAM_FLUSH_BYTES = 64 * 1024
 
 admin_bp = Blueprint('admin', __name__)
 
-def admin_required(f):
-    @wraps(f)
-    @jwt_required()
-    def decorated_function(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if not user or user.role != 'admin':
-            return jsonify({"error": "Admin access required"}), 403
-        return f(*args, **kwargs)
-    return decorated_function
+admin_bp.before_request(route_reads_to_replica)
+
+admin_required = role_required('admin', "Admin access required")
+
+EMPLOYEE_FIELDS = ('id', 'emp_id', 'email', 'role', 'department_id', 'leave_balance', 'profile')
 
 @admin_bp.route('/api/admin/employees', methods=['GET'])
 @admin_required
 def get_all_employees():
-    employees = User.query.all()
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else list(EMPLOYEE_FIELDS)
+    unknown = set(fields) - set(EMPLOYEE_FIELDS)
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+
+    columns = [getattr(User, field) for field in fields if field in ('emp_id', 'email', 'role', 'department_id')]
+    query = User.query.options(db.load_only(User.id, *columns))
+    if 'profile' in fields:
+        query = query.options(db.joinedload(User.profile))
+    try:
+        employees, next_cursor = keyset_page(
+            query, User.id, request.args.get('cursor'), page_limit(request.args.get('limit', type=int))
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    balances = {}
+    if 'leave_balance' in fields:
+        balances = leave_balances_for([employee.id for employee in employees], datetime.utcnow().year)
+
     employee_list = []
-    current_year = datetime.utcnow().year
-    
     for employee in employees:
-        profile = employee.profile
-        leave_balance = employee.leave_balance(year=current_year)
-        employee_data = {
-            "id": employee.id,
-            "emp_id": employee.emp_id,
-            "email": employee.email,
-            "role": employee.role,
-            "department_id": employee.department_id,
-            "leave_balance": leave_balance,
-            "profile": None
-        }
-        
-        if profile:
-            employee_data["profile"] = {
-                "full_name": profile.full_name,
-                "salary": profile.salary,
-                "contact_email": profile.contact_email,
-                "phone": profile.phone
-            }
-        
+        employee_data = {}
+        for field in fields:
+            if field == 'leave_balance':
+                employee_data[field] = balances[employee.id]
+            elif field == 'profile':
+                profile = employee.profile
+                employee_data[field] = {
+                    "full_name": profile.full_name,
+                    "salary": profile.salary,
+                    "contact_email": profile.contact_email,
+                    "phone": profile.phone
+                } if profile else None
+            else:
+                employee_data[field] = getattr(employee, field)
         employee_list.append(employee_data)
-    
-    return jsonify({"employees": employee_list}), 200
+
+    return jsonify({
+        "employees": employee_list,
+        "next_cursor": next_cursor
+    }), 200
 
 @admin_bp.route('/api/admin/employees', methods=['POST'])
 @admin_required
@@ -117,6 +144,10 @@ def update_employee(emp_id):
         # Update user data
         if 'email' in data:
             user.email = data['email']
+        principal_changed = (
+            ('role' in data and data['role'] != user.role)
+            or ('department_id' in data and data['department_id'] != user.department_id)
+        )
         if 'role' in data:
             user.role = data['role']
         if 'department_id' in data:
@@ -137,6 +168,8 @@ def update_employee(emp_id):
                 profile.phone = data['phone']
         
         db.session.commit()
+        if principal_changed:
+            invalidate_principal(user.id)
         return jsonify({"message": "Employee updated successfully"}), 200
     except Exception as e:
         db.session.rollback()
@@ -144,20 +177,49 @@ def update_employee(emp_id):
 
 @admin_bp.route('/api/admin/departments', methods=['GET'])
 @admin_required
+@cached_response(scopes=('departments', 'users'))
 def get_all_departments():
-    departments = Department.query.all()
+    departments = db.session.query(Department.id, Department.name, db.func.count(User.id)) \
+        .outerjoin(User, User.department_id == Department.id) \
+        .group_by(Department.id, Department.name).order_by(Department.id)
     department_list = []
-    
-    for dept in departments:
-        employees = User.query.filter_by(department_id=dept.id).count()
+
+    for dept_id, name, employees in departments:
         department_list.append({
-            "id": dept.id,
-            "name": dept.name,
+            "id": dept_id,
+            "name": name,
             "employee_count": employees
         })
     
     return jsonify({"departments": department_list}), 200
 
+def _department_stats_cache():
+    return app_singleton('department_stats_cache', lambda: TTLCache(
+        maxsize=4, ttl=current_app.config['DEPARTMENT_STATS_TTL']
+    ))
+
+@admin_bp.route('/api/admin/departments/stats', methods=['GET'])
+@admin_required
+def get_department_stats():
+    today = datetime.utcnow().date()
+    cache = _department_stats_cache()
+    stats = cache.get(today)
+    if stats is None:
+        stats = []
+        for dept_id, name, headcount, average_salary, on_leave, present in department_stats(today):
+            stats.append({
+                "id": dept_id,
+                "name": name,
+                "headcount": headcount,
+                "average_salary": round(float(average_salary), 2) if average_salary is not None else None,
+                "on_leave_today": on_leave,
+                "present_today": present,
+                "attendance_rate": round(present / headcount, 4) if headcount else None
+            })
+        cache.set(today, stats)
+
+    return jsonify({"date": today.strftime('%Y-%m-%d'), "departments": stats}), 200
+
 @admin_bp.route('/api/admin/departments', methods=['POST'])
 @admin_required
 def add_department():
@@ -184,17 +246,100 @@ def add_department():
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@admin_bp.route('/api/admin/holidays', methods=['GET'])
+@admin_required
+def get_holidays():
+    query = Holiday.query.order_by(Holiday.date)
+    year = request.args.get('year', type=int)
+    if year:
+        query = query.filter(Holiday.date >= datetime(year, 1, 1).date(), Holiday.date < datetime(year + 1, 1, 1).date())
+    return jsonify({"holidays": [
+        {"id": holiday.id, "date": holiday.date.strftime('%Y-%m-%d'), "name": holiday.name}
+        for holiday in query
+    ]}), 200
+
+def _holidays_changed(day):
+    """Recount leave charged around `day`; leave is booked to its start year, so
+    a holiday can also change requests that began the year before"""
+    invalidate_business_calendar()
+    return rebuild_leave_ledger_years([day.year - 1, day.year])
+
+@admin_bp.route('/api/admin/holidays', methods=['POST'])
+@admin_required
+def add_holiday():
+    data = request.get_json()
+    if not data or not data.get('date') or not data.get('name'):
+        return jsonify({"error": "date and name are required"}), 400
+    try:
+        day = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    if Holiday.query.filter_by(date=day).first():
+        return jsonify({"error": "A holiday already exists on this date"}), 409
+
+    holiday = Holiday(date=day, name=data['name'])
+    try:
+        db.session.add(holiday)
+        db.session.flush()
+        recounted = _holidays_changed(day)
+        db.session.commit()
+        return jsonify({
+            "message": "Holiday added successfully",
+            "id": holiday.id,
+            "recounted_employees": len(recounted)
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        invalidate_business_calendar()
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route('/api/admin/holidays/<int:holiday_id>', methods=['DELETE'])
+@admin_required
+def delete_holiday(holiday_id):
+    holiday = Holiday.query.get(holiday_id)
+    if not holiday:
+        return jsonify({"error": "Holiday not found"}), 404
+    try:
+        day = holiday.date
+        db.session.delete(holiday)
+        db.session.flush()
+        recounted = _holidays_changed(day)
+        db.session.commit()
+        return jsonify({
+            "message": "Holiday deleted successfully",
+            "recounted_employees": len(recounted)
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        invalidate_business_calendar()
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route('/api/admin/availability', methods=['GET'])
+@admin_required
+def get_department_availability():
+    department_id = request.args.get('department_id', type=int)
+    if department_id is None:
+        return jsonify({"error": "department_id is required"}), 400
+    return availability_response(User.department_id == department_id)
+
 @admin_bp.route('/api/admin/leave-requests', methods=['GET'])
 @admin_required
 def get_all_leave_requests():
     leave_requests = LeaveRequest.query.all()
     request_list = []
     current_year = datetime.utcnow().year
+
+    employee_ids = {leave.employee_id for leave in leave_requests}
+    employees = {
+        employee.id: employee
+        for employee in User.query.options(db.joinedload(User.profile)).filter(User.id.in_(employee_ids))
+    } if employee_ids else {}
+    balances = leave_balances_for(employees.keys(), current_year)
     
     for leave in leave_requests:
-        employee = User.query.get(leave.employee_id)
+        employee = employees.get(leave.employee_id)
         profile = employee.profile if employee else None
-        leave_balance = employee.leave_balance(year=current_year) if employee else None
+        leave_balance = balances[employee.id] if employee else None
         
         request_list.append({
             "id": leave.id,
@@ -209,23 +354,27 @@ def get_all_leave_requests():
     
     return jsonify({"leave_requests": request_list}), 200
 
+@admin_bp.route('/api/admin/leave-requests/bulk', methods=['PUT'])
+@admin_required
+def bulk_update_leave_requests():
+    return bulk_transition('pending_admin', ('approved', 'rejected'))
+
 @admin_bp.route('/api/admin/leave-requests/<int:request_id>', methods=['PUT'])
 @admin_required
 def update_leave_request(request_id):
     data = request.get_json()
-    leave_request = LeaveRequest.query.get(request_id)
-    
-    if not leave_request:
-        return jsonify({"error": "Leave request not found"}), 404
-    
-    if leave_request.status != 'pending_admin':
-        return jsonify({"error": "Leave request is not pending admin approval"}), 400
-
     if 'status' not in data:
         return jsonify({"error": "Status is required"}), 400
 
     try:
-        leave_request.status = data['status']
+        # Guarded by the current status, so concurrent approvals charge the ledger once
+        result, _ = transition_leave_requests([request_id], 'pending_admin', data['status'])[request_id]
+        if result == 'not_found':
+            db.session.rollback()
+            return jsonify({"error": "Leave request not found"}), 404
+        if result != 'updated':
+            db.session.rollback()
+            return jsonify({"error": "Leave request is not pending admin approval"}), 400
         db.session.commit()
         return jsonify({"message": "Leave request updated successfully"}), 200
     except Exception as e:
@@ -252,24 +401,237 @@ def get_employee_attendance(emp_id):
         "attendance": records
     }), 200
 
+def _parse_date_arg(name):
+    """Optional YYYY-MM-DD query argument; raises ValueError when malformed"""
+    value = request.args.get(name)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def _format_attendance(day, status, check_in_time, check_out_time):
+    return {
+        "date": day.strftime('%Y-%m-%d'),
+        "status": status,
+        "check_in_time": check_in_time.strftime('%H:%M:%S') if check_in_time else None,
+        "check_out_time": check_out_time.strftime('%H:%M:%S') if check_out_time else None
+    }
+
 @admin_bp.route('/api/admin/attendance', methods=['GET'])
 @admin_required
 def get_all_attendance():
-    users = User.query.all()
-    all_attendance = []
-    for user in users:
-        attendance_records = Attendance.query.filter_by(user_id=user.id).all()
-        records = [{
-            "date": record.date.strftime('%Y-%m-%d'),
-            "status": record.status,
-            "check_in_time": record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else None,
-            "check_out_time": record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else None
-        } for record in attendance_records]
-        all_attendance.append({
-            "emp_id": user.emp_id,
-            "attendance": records
-        })
-    return jsonify({"all_attendance": all_attendance}), 200
+    try:
+        date_from = _parse_date_arg('from')
+        date_to = _parse_date_arg('to')
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    department_id = request.args.get('department_id', type=int)
+
+    # Date filters go in the join condition so employees without matching
+    # records are still listed with an empty attendance array
+    join_on = [Attendance.user_id == User.id]
+    if date_from:
+        join_on.append(Attendance.date >= date_from)
+    if date_to:
+        join_on.append(Attendance.date <= date_to)
+    query = db.select(
+        User.id, User.emp_id, Attendance.date, Attendance.status,
+        Attendance.check_in_time, Attendance.check_out_time
+    ).outerjoin(Attendance, db.and_(*join_on)).order_by(User.id, Attendance.date)
+    if department_id is not None:
+        query = query.where(User.department_id == department_id)
+
+    def generate():
+        # Same document jsonify would build, written out one employee at a time
+        buffer = ['{"all_attendance":[']
+        size = 0
+        current_user = None
+        emp_id = None
+        first_record = True
+        rows = db.session.execute(query.execution_options(yield_per=ATTENDANCE_STREAM_CHUNK))
+        for user_id, row_emp_id, day, status, check_in_time, check_out_time in rows:
+            if user_id != current_user:
+                if current_user is not None:
+                    buffer.append('],"emp_id":%s},' % json.dumps(emp_id))
+                buffer.append('{"attendance":[')
+                current_user, emp_id, first_record = user_id, row_emp_id, True
+            if day is None:
+                continue
+            chunk = json.dumps(_format_attendance(day, status, check_in_time, check_out_time),
+                               sort_keys=True, separators=(',', ':'))
+            buffer.append(chunk if first_record else ',' + chunk)
+            first_record = False
+            size += len(chunk)
+            if size >= STREAM_FLUSH_BYTES:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if current_user is not None:
+            buffer.append('],"emp_id":%s}' % json.dumps(emp_id))
+        buffer.append(']}\n')
+        yield ''.join(buffer)
+
+    return Response(stream_with_context(generate()), mimetype='application/json'), 200
+
+def _parse_bulk_attendance():
+    """Read a JSON array or NDJSON request body into a list of records"""
+    body = request.get_data(as_text=True)
+    if request.mimetype == 'application/x-ndjson' or not body.lstrip().startswith('['):
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    records = json.loads(body)
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON array of attendance records")
+    return records
+
+def _parse_bulk_time(value):
+    if value in (None, ''):
+        return None
+    return time.fromisoformat(value)
+
+@admin_bp.route('/api/admin/attendance/bulk', methods=['POST'])
+@admin_required
+def bulk_upsert_attendance():
+    try:
+        records = _parse_bulk_attendance()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request body: {e}"}), 400
+    if not records:
+        return jsonify({"error": "No attendance records supplied"}), 400
+
+    emp_ids = {
+        record.get('emp_id') for record in records
+        if isinstance(record, dict) and isinstance(record.get('emp_id'), str)
+    }
+    user_ids = dict(
+        db.session.query(User.emp_id, User.id).filter(User.emp_id.in_(emp_ids))
+    ) if emp_ids else {}
+
+    results = []
+    rows = {}
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            results.append({"index": index, "result": "error", "error": "Record must be an object"})
+            continue
+        result = {"index": index, "emp_id": record.get('emp_id'), "date": record.get('date')}
+        results.append(result)
+
+        if not isinstance(record.get('emp_id'), str):
+            result.update(result="error", error="emp_id must be a string")
+            continue
+        user_id = user_ids.get(record.get('emp_id'))
+        status = record.get('status', 'present')
+        if user_id is None:
+            result.update(result="error", error="Employee not found")
+            continue
+        if status not in ATTENDANCE_STATUSES:
+            result.update(result="error", error=f"Invalid status: {status}")
+            continue
+        try:
+            row = {
+                "user_id": user_id,
+                "date": datetime.strptime(record.get('date') or '', '%Y-%m-%d').date(),
+                "status": status,
+                "check_in_time": _parse_bulk_time(record.get('check_in')),
+                "check_out_time": _parse_bulk_time(record.get('check_out')),
+            }
+        except (TypeError, ValueError):
+            result.update(result="error", error="Invalid date or time format. Use YYYY-MM-DD and HH:MM[:SS]")
+            continue
+
+        # A later record for the same employee and day replaces an earlier one
+        previous = rows.get((user_id, row['date']))
+        if previous:
+            previous[0].update(result="superseded", superseded_by=index)
+        rows[(user_id, row['date'])] = (result, row)
+        result["result"] = "upserted"
+
+    values = [row for _, row in rows.values()]
+    # One compiled upsert, executed in batches; the drivers send each batch as
+    # a multi-row statement (Postgres) or a prepared executemany (SQLite)
+    stmt = dialect_insert(Attendance.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'date'],
+        set_={
+            "status": stmt.excluded.status,
+            "check_in_time": stmt.excluded.check_in_time,
+            "check_out_time": stmt.excluded.check_out_time,
+        }
+    )
+    try:
+        lock_attendance_rollup({row['user_id'] for row in values})
+        for start in range(0, len(values), BULK_ATTENDANCE_BATCH):
+            batch = values[start:start + BULK_ATTENDANCE_BATCH]
+            db.session.execute(stmt, batch)
+            # Recount the touched months rather than adding deltas, so replays racing
+            # on the same new rows cannot count them twice
+            AttendanceMonthly.refresh({(row['user_id'], month_start(row['date'])) for row in batch})
+        bump_data_versions({row['user_id'] for row in values})
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "message": "Attendance records processed",
+        "upserted": len(values),
+        "failed": sum(1 for result in results if result["result"] == "error"),
+        "results": results
+    }), 200
+
+def _attendance_counts(present, absent, leave):
+    recorded = present + absent + leave
+    return {
+        "present": present,
+        "absent": absent,
+        "leave": leave,
+        "recorded_days": recorded,
+        "present_rate": round(present / recorded, 4) if recorded else None,
+        "absent_rate": round(absent / recorded, 4) if recorded else None,
+        "leave_rate": round(leave / recorded, 4) if recorded else None
+    }
+
+@admin_bp.route('/api/admin/reports/attendance', methods=['GET'])
+@admin_required
+def get_attendance_report():
+    """Monthly attendance per department and employee, read from the rollup"""
+    try:
+        month = datetime.strptime(request.args['month'], '%Y-%m').date() \
+            if request.args.get('month') else datetime.utcnow().date().replace(day=1)
+    except ValueError:
+        return jsonify({"error": "Invalid month format. Use YYYY-MM"}), 400
+    department_id = request.args.get('department', type=int)
+    if request.args.get('department') and department_id is None:
+        return jsonify({"error": "department must be a department id"}), 400
+
+    # Employees are grouped by their current department
+    query = db.session.query(
+        Department.id, Department.name, User.emp_id, EmployeeProfile.full_name,
+        AttendanceMonthly.present, AttendanceMonthly.absent, AttendanceMonthly.leave
+    ).join(User, User.id == AttendanceMonthly.user_id) \
+        .outerjoin(EmployeeProfile, EmployeeProfile.user_id == User.id) \
+        .outerjoin(Department, Department.id == User.department_id) \
+        .filter(AttendanceMonthly.month == month)
+    if department_id is not None:
+        query = query.filter(User.department_id == department_id)
+
+    departments = {}
+    for dept_id, dept_name, emp_id, full_name, present, absent, leave in query.order_by(Department.name, User.emp_id):
+        department = departments.get(dept_id)
+        if department is None:
+            department = departments[dept_id] = {"id": dept_id, "name": dept_name, "totals": [0, 0, 0], "employees": []}
+        department["employees"].append({"emp_id": emp_id, "name": full_name or emp_id,
+                                        **_attendance_counts(present, absent, leave)})
+        totals = department["totals"]
+        totals[0] += present
+        totals[1] += absent
+        totals[2] += leave
+
+    report = []
+    for department in departments.values():
+        totals = department.pop("totals")
+        report.append({**department, "headcount": len(department["employees"]), **_attendance_counts(*totals)})
+
+    return jsonify({
+        "month": month.strftime('%Y-%m'),
+        "working_days": get_business_calendar().business_days(month, next_month(month) - timedelta(days=1)),
+        "departments": report
+    }), 200
 
 @admin_bp.route('/api/admin/leave-balance/<emp_id>', methods=['GET'])
 @admin_required
@@ -278,7 +640,7 @@ def get_employee_leave_balance(emp_id):
     if not user:
         return jsonify({"error": "Employee not found"}), 404
     current_year = datetime.utcnow().year
-    leave_balance = user.leave_balance(year=current_year)
+    leave_balance = LeaveLedger.balance_for(user.id, current_year)
     return jsonify({
         "emp_id": user.emp_id,
         "leave_balance": leave_balance
@@ -287,126 +649,33 @@ def get_employee_leave_balance(emp_id):
 
 @admin_bp.route('/api/admin/leave-balances', methods=['GET'])
 @admin_required
+@cached_response(scopes=('users', 'leave'))
 def get_all_leave_balances():
     users = User.query.all()
     current_year = datetime.utcnow().year
+    leave_balances = leave_balances_for(None, current_year)
     balances = []
     for user in users:
         balances.append({
             "emp_id": user.emp_id,
-            "leave_balance": user.leave_balance(year=current_year)
+            "leave_balance": leave_balances[user.id]
         })
     return jsonify({"leave_balances": balances}), 200
 
-def generate_employee_csv(user):
-    output = StringIO()
-    writer = csv.writer(output)
-    profile = user.profile
-
-    writer.writerow(['Employee Details'])
-    writer.writerow(['emp_id', 'full_name', 'email', 'role', 'department', 'leave_balance'])
-    writer.writerow([
-        user.emp_id,
-        profile.full_name if profile else '',
-        user.email,
-        user.role,
-        user.department.name if user.department else '',
-        user.leave_balance(datetime.utcnow().year)
-    ])
-    writer.writerow([])
-
-    writer.writerow(['Attendance'])
-    writer.writerow(['date', 'status', 'check_in_time', 'check_out_time'])
-    for record in user.attendance:
-        writer.writerow([
-            record.date.strftime('%Y-%m-%d'),
-            record.status,
-            record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else '',
-            record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else ''
-        ])
-    writer.writerow([])
-
-    writer.writerow(['Leave Requests'])
-    writer.writerow(['start_date', 'end_date', 'reason', 'status'])
-    for leave in user.leave_requests:
-        writer.writerow([
-            leave.start_date.strftime('%Y-%m-%d'),
-            leave.end_date.strftime('%Y-%m-%d'),
-            leave.reason,
-            leave.status
-        ])
-    return output.getvalue()
-
-def generate_employee_pdf(user):
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    y = height - 40
-    profile = user.profile
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Employee Details")
-    y -= 20
-    p.setFont("Helvetica", 12)
-    p.drawString(40, y, f"ID: {user.emp_id}")
-    y -= 15
-    p.drawString(40, y, f"Name: {profile.full_name if profile else ''}")
-    y -= 15
-    p.drawString(40, y, f"Email: {user.email}")
-    y -= 15
-    p.drawString(40, y, f"Role: {user.role}")
-    y -= 15
-    p.drawString(40, y, f"Department: {user.department.name if user.department else ''}")
-    y -= 15
-    p.drawString(40, y, f"Leave Balance: {user.leave_balance(datetime.utcnow().year)}")
-    y -= 30
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Attendance")
-    y -= 20
-    p.setFont("Helvetica", 10)
-    for record in user.attendance:
-        p.drawString(40, y, f"{record.date.strftime('%Y-%m-%d')}, {record.status}, {record.check_in_time or ''}, {record.check_out_time or ''}")
-        y -= 12
-        if y < 60:
-            p.showPage()
-            y = height - 40
-
-    y -= 20
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Leave Requests")
-    y -= 20
-    p.setFont("Helvetica", 10)
-    for leave in user.leave_requests:
-        p.drawString(40, y, f"{leave.start_date.strftime('%Y-%m-%d')} to {leave.end_date.strftime('%Y-%m-%d')}, {leave.reason}, {leave.status}")
-        y -= 12
-        if y < 60:
-            p.showPage()
-            y = height - 40
-
-    p.save()
-    buffer.seek(0)
-    return buffer
-
 @admin_bp.route('/api/admin/export-employee', methods=['GET'])
 @admin_required
 def export_employee_data_csv():
     emp_id = request.args.get('emp_id')
-    output = StringIO()
     if emp_id:
         user = User.query.filter_by(emp_id=emp_id).first()
         if not user:
             return jsonify({"error": "Employee not found"}), 404
-        csv_data = generate_employee_csv(user)
-        output.write(csv_data)
-    else:
-        users = User.query.all()
-        for user in users:
-            output.write(generate_employee_csv(user))
-            output.write('\n\n')
-    output.seek(0)
+        return send_cached_report(
+            user, 'csv', lambda: generate_employee_csv(user).encode('utf-8'),
+            mimetype='text/csv', download_name='employee_data.csv'
+        )
     return Response(
-        output,
+        stream_with_context(iter_employee_csv()),
         mimetype='text/csv',
         headers={"Content-Disposition": "attachment;filename=employee_data.csv"}
     )
@@ -419,7 +688,91 @@ def export_employee_data_pdf():
         user = User.query.filter_by(emp_id=emp_id).first()
         if not user:
             return jsonify({"error": "Employee not found"}), 404
-        pdf_buffer = generate_employee_pdf(user)
-        return send_file(pdf_buffer, as_attachment=True, download_name='employee_data.pdf', mimetype='application/pdf')
+        return send_cached_report(
+            user, 'pdf', lambda: generate_employee_pdf(user).getvalue(),
+            mimetype='application/pdf', download_name='employee_data.pdf'
+        )
     else:
-        return jsonify({"error": "PDF export for all users not implemented"}), 400
+        archive = iter_employee_pdf_zip(
+            department_id=request.args.get('department_id', type=int),
+            workers=current_app.config['EXPORT_PDF_WORKERS']
+        )
+        return Response(
+            stream_with_context(archive),
+            mimetype='application/zip',
+            headers={"Content-Disposition": "attachment;filename=employee_reports.zip"}
+        )
+
+def _export_job_json(job):
+    return {
+        "id": job.id,
+        "format": job.format,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+        "download_url": url_for('admin.download_export', job_id=job.id) if job.status == 'done' else None
+    }
+
+@admin_bp.route('/api/admin/exports', methods=['POST'])
+@admin_required
+def create_export():
+    data = request.get_json() or {}
+    export_format = data.get('format')
+    if export_format not in export_jobs.EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(export_jobs.EXPORT_FORMATS)}"}), 400
+
+    params = {}
+    emp_ids = data.get('emp_ids')
+    if emp_ids is not None:
+        if not isinstance(emp_ids, list) or not emp_ids or not all(isinstance(emp_id, str) for emp_id in emp_ids):
+            return jsonify({"error": "emp_ids must be a non-empty list"}), 400
+        found = dict(db.session.query(User.emp_id, User.id).filter(User.emp_id.in_(emp_ids)))
+        missing = [emp_id for emp_id in emp_ids if emp_id not in found]
+        if missing:
+            return jsonify({"error": "Employee not found", "emp_ids": missing}), 404
+        params['user_ids'] = sorted(set(found.values()))
+    department_id = data.get('department_id')
+    if department_id is not None:
+        if not isinstance(department_id, int) or isinstance(department_id, bool):
+            return jsonify({"error": "department_id must be an integer"}), 400
+        if db.session.get(Department, department_id) is None:
+            return jsonify({"error": "Department not found"}), 400
+        params['department_id'] = department_id
+    if export_format == 'pdf' and len(params.get('user_ids', [])) != 1:
+        return jsonify({"error": "PDF exports cover exactly one employee; use zip for several"}), 400
+
+    try:
+        job = export_jobs.enqueue(export_format, params, requested_by=int(get_jwt_identity()))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    return jsonify(_export_job_json(job)), 202
+
+@admin_bp.route('/api/admin/exports/<int:job_id>', methods=['GET'])
+@admin_required
+def get_export(job_id):
+    job = db.session.get(ExportJob, job_id)
+    if not job:
+        return jsonify({"error": "Export not found"}), 404
+    return jsonify(_export_job_json(job)), 200
+
+@admin_bp.route('/api/admin/exports/<int:job_id>/download', methods=['GET'])
+@admin_required
+def download_export(job_id):
+    job = db.session.get(ExportJob, job_id)
+    if not job:
+        return jsonify({"error": "Export not found"}), 404
+    if job.status != 'done':
+        return jsonify({"error": f"Export is {job.status}"}), 409
+    if not job.file_path or not os.path.exists(job.file_path) or job.expires_at < datetime.utcnow():
+        return jsonify({"error": "Export has expired"}), 410
+    return send_file(
+        job.file_path,
+        mimetype=export_jobs.EXPORT_MIMETYPES[job.format],
+        as_attachment=True,
+        download_name=f"employee_export_{job.id}.{job.format}"
+    )
@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash
-from models import User
+from models import db, User
+from passwords import needs_rehash, verify_password
+from principals import principal_claims
+from revocation import get_revocation_store
+from datetime import datetime
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt
 
 auth_bp = Blueprint('auth', __name__)
@@ -13,11 +16,20 @@ def login():
         return jsonify({"error": "Missing email or password"}), 400
 
     user = User.query.filter_by(email=data['email']).first()
-    if not user or not check_password_hash(user.password_hash, data['password']):
+    if not user or not verify_password(user.password_hash, data['password']):
         return jsonify({"error": "Invalid credentials"}), 401
 
-    access_token = create_access_token(identity=str(user.id))
-    refresh_token = create_refresh_token(identity=str(user.id))
+    # Upgrade hashes made with older cost parameters while we have the password
+    if needs_rehash(user.password_hash):
+        try:
+            user.set_password(data['password'])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+    claims = principal_claims(user)
+    access_token = create_access_token(identity=str(user.id), additional_claims=claims)
+    refresh_token = create_refresh_token(identity=str(user.id), additional_claims=claims)
     return jsonify({
         "message": "Login successful",
         "access_token": access_token,
@@ -33,15 +45,15 @@ def login():
 @jwt_required(refresh=True)
 def refresh():
     identity = get_jwt_identity()
-    access_token = create_access_token(identity=identity)
+    user = User.query.get(identity)
+    if not user:
+        return jsonify({"error": "User not found"}), 401
+    access_token = create_access_token(identity=identity, additional_claims=principal_claims(user))
     return jsonify(access_token=access_token), 200
 
-# Define a simple in-memory blacklist set at the top of the file or import it if defined elsewhere
-blacklist = set()
-
 @auth_bp.route('/api/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    jti = get_jwt()['jti']
-    blacklist.add(jti)
-    return jsonify({"message": "Logout successful"}), 200
\ No newline at end of file
+    token = get_jwt()
+    get_revocation_store().revoke(token['jti'], datetime.utcfromtimestamp(token['exp']))
+    return jsonify({"message": "Logout successful"}), 200
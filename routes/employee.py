@@ -1,20 +1,24 @@
 from flask import Blueprint, request, jsonify
 # from flask_login import login_required, current_user
-from models import db, User, EmployeeProfile, Department, LeaveRequest, Attendance
+from models import db, User, EmployeeProfile, Department, LeaveRequest, Attendance, LeaveLedger, overlapping_leave_ids
+from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 
-import csv
-from io import StringIO, BytesIO
-from flask import Response, send_file
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from exports import generate_employee_csv, generate_employee_pdf
+from report_cache import send_cached_report
+from principals import current_principal
+from database import route_reads_to_replica
+from http_cache import cached_response
 
 
 employee_bp = Blueprint('employee', __name__)
 
+employee_bp.before_request(route_reads_to_replica)
+
 @employee_bp.route('/api/profile', methods=['GET'])
 @jwt_required()
+@cached_response(scopes=('departments',), per_user=True)
 def get_profile():
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
@@ -68,8 +72,7 @@ def update_contact_info():
 @employee_bp.route('/api/leave', methods=['POST'])
 @jwt_required()
 def submit_leave_request():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_principal()
     data = request.get_json()
 
     required_fields = ['start_date', 'end_date', 'reason']
@@ -84,6 +87,10 @@ def submit_leave_request():
         if start_date > end_date:
             return jsonify({"error": "Start date cannot be after end date"}), 400
 
+        conflicts = overlapping_leave_ids(user.id, start_date, end_date)
+        if conflicts:
+            return _overlap_response(conflicts)
+
         leave_request = LeaveRequest(
             employee_id=user.id,
             start_date=start_date,
@@ -93,6 +100,7 @@ def submit_leave_request():
         )
 
         db.session.add(leave_request)
+        LeaveLedger.record_transition(leave_request, None, leave_request.status)
         db.session.commit()
 
         return jsonify({
@@ -102,15 +110,24 @@ def submit_leave_request():
         }), 201
     except ValueError:
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    except IntegrityError:
+        # A concurrent submission won the race; the database constraint caught it
+        db.session.rollback()
+        return _overlap_response(overlapping_leave_ids(user.id, start_date, end_date))
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
+
+def _overlap_response(conflicts):
+    return jsonify({
+        "error": "Leave request overlaps existing approved or pending leave",
+        "conflicting_request_ids": conflicts
+    }), 409
     
 @employee_bp.route('/api/leave', methods=['GET'])
 @jwt_required()
 def get_leave_requests():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_principal()
     leave_requests = LeaveRequest.query.filter_by(employee_id=user.id).all()
     request_list = []
 
@@ -128,8 +145,7 @@ def get_leave_requests():
 @employee_bp.route('/api/attendance', methods=['GET'])
 @jwt_required()
 def get_self_attendance():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_principal()
     attendance_records = Attendance.query.filter_by(user_id=user.id).all()
     records = [{
         "date": record.date.strftime('%Y-%m-%d'),
@@ -146,8 +162,7 @@ def get_self_attendance():
 @employee_bp.route('/api/attendance', methods=['POST'])
 @jwt_required()
 def mark_attendance():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_principal()
     data = request.get_json()
     today = datetime.utcnow().date()
     status = data.get('status', 'present')
@@ -165,130 +180,44 @@ def mark_attendance():
         check_in_time=check_in_time,
         check_out_time=check_out_time
     )
-    db.session.add(attendance)
-    db.session.commit()
+    try:
+        db.session.add(attendance)
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent check-in won the race; uq_attendance_user_date caught it
+        db.session.rollback()
+        return jsonify({"error": "Attendance already marked for today"}), 400
     return jsonify({"message": "Attendance marked"}), 201
 
 
 @employee_bp.route('/api/leave-balance', methods=['GET'])
 @jwt_required()
+@cached_response(per_user=True)
 def get_self_leave_balance():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_principal()
     current_year = datetime.utcnow().year
-    leave_balance = user.leave_balance(year=current_year)
+    leave_balance = LeaveLedger.balance_for(user.id, current_year)
     return jsonify({
         "emp_id": user.emp_id,
         "leave_balance": leave_balance
     }), 200
 
-def generate_employee_csv(user):
-    output = StringIO()
-    writer = csv.writer(output)
-    profile = user.profile
-
-    writer.writerow(['Employee Details'])
-    writer.writerow(['emp_id', 'full_name', 'email', 'role', 'department', 'leave_balance'])
-    writer.writerow([
-        user.emp_id,
-        profile.full_name if profile else '',
-        user.email,
-        user.role,
-        user.department.name if user.department else '',
-        user.leave_balance(datetime.utcnow().year)
-    ])
-    writer.writerow([])
-
-    writer.writerow(['Attendance'])
-    writer.writerow(['date', 'status', 'check_in_time', 'check_out_time'])
-    for record in user.attendance:
-        writer.writerow([
-            record.date.strftime('%Y-%m-%d'),
-            record.status,
-            record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else '',
-            record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else ''
-        ])
-    writer.writerow([])
-
-    writer.writerow(['Leave Requests'])
-    writer.writerow(['start_date', 'end_date', 'reason', 'status'])
-    for leave in user.leave_requests:
-        writer.writerow([
-            leave.start_date.strftime('%Y-%m-%d'),
-            leave.end_date.strftime('%Y-%m-%d'),
-            leave.reason,
-            leave.status
-        ])
-    return output.getvalue()
-
 @employee_bp.route('/api/export-self', methods=['GET'])
 @jwt_required()
 def export_self_data_csv():
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
-    csv_data = generate_employee_csv(user)
-    output = StringIO(csv_data)
-    return Response(
-        output,
-        mimetype='text/csv',
-        headers={"Content-Disposition": "attachment;filename=employee_data.csv"}
+    return send_cached_report(
+        user, 'csv', lambda: generate_employee_csv(user).encode('utf-8'),
+        mimetype='text/csv', download_name='employee_data.csv'
     )
 
-def generate_employee_pdf(user):
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    y = height - 40
-    profile = user.profile
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Employee Details")
-    y -= 20
-    p.setFont("Helvetica", 12)
-    p.drawString(40, y, f"ID: {user.emp_id}")
-    y -= 15
-    p.drawString(40, y, f"Name: {profile.full_name if profile else ''}")
-    y -= 15
-    p.drawString(40, y, f"Email: {user.email}")
-    y -= 15
-    p.drawString(40, y, f"Role: {user.role}")
-    y -= 15
-    p.drawString(40, y, f"Department: {user.department.name if user.department else ''}")
-    y -= 15
-    p.drawString(40, y, f"Leave Balance: {user.leave_balance(datetime.utcnow().year)}")
-    y -= 30
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Attendance")
-    y -= 20
-    p.setFont("Helvetica", 10)
-    for record in user.attendance:
-        p.drawString(40, y, f"{record.date.strftime('%Y-%m-%d')}, {record.status}, {record.check_in_time or ''}, {record.check_out_time or ''}")
-        y -= 12
-        if y < 60:
-            p.showPage()
-            y = height - 40
-
-    y -= 20
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Leave Requests")
-    y -= 20
-    p.setFont("Helvetica", 10)
-    for leave in user.leave_requests:
-        p.drawString(40, y, f"{leave.start_date.strftime('%Y-%m-%d')} to {leave.end_date.strftime('%Y-%m-%d')}, {leave.reason}, {leave.status}")
-        y -= 12
-        if y < 60:
-            p.showPage()
-            y = height - 40
-
-    p.save()
-    buffer.seek(0)
-    return buffer
-
 @employee_bp.route('/api/export-self-pdf', methods=['GET'])
 @jwt_required()
 def export_self_data_pdf():
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
-    pdf_buffer = generate_employee_pdf(user)
-    return send_file(pdf_buffer, as_attachment=True, download_name='employee_data.pdf', mimetype='application/pdf')
\ No newline at end of file
+    return send_cached_report(
+        user, 'pdf', lambda: generate_employee_pdf(user).getvalue(),
+        mimetype='application/pdf', download_name='employee_data.pdf'
+    )
@@ -1,35 +1,74 @@
 from flask import Blueprint, request, jsonify
 # from flask_login import login_required, current_user
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, LeaveRequest, User, EmployeeProfile
-from functools import wraps
+from models import db, LeaveRequest, User, EmployeeProfile, transition_leave_requests
+from principals import role_required, current_principal
+from pagination import keyset_page, page_limit
+from leave_actions import bulk_transition
+from availability import availability_response
 
 manager_bp = Blueprint('manager', __name__)
 
-def manager_required(f):
-    @wraps(f)
-    @jwt_required()
-    def decorated_function(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if not user or user.role != 'manager':
-            return jsonify({"error": "Manager access required"}), 403
-        return f(*args, **kwargs)
-    return decorated_function
+manager_required = role_required('manager', "Manager access required")
 
-@manager_bp.route('/api/manager/leave-requests/<int:request_id>', methods=['PUT'])
+@manager_bp.route('/api/manager/leave-requests', methods=['GET'])
 @manager_required
-def manager_update_leave_request(request_id):
-    leave_request = LeaveRequest.query.get(request_id)
-    if not leave_request:
-        return jsonify({"error": "Leave request not found"}), 404
+def get_team_leave_requests():
+    manager = current_principal()
+    query = db.session.query(LeaveRequest, User.emp_id, EmployeeProfile.full_name) \
+        .join(User, User.id == LeaveRequest.employee_id) \
+        .outerjoin(EmployeeProfile, EmployeeProfile.user_id == User.id) \
+        .filter(User.manager_id == manager.id, LeaveRequest.status == 'pending_manager')
+    try:
+        rows, next_cursor = keyset_page(
+            query, LeaveRequest.id, request.args.get('cursor'), page_limit(request.args.get('limit', type=int)),
+            row_id=lambda row: row[0].id
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
 
-    # Only allow update if status is pending_manager
-    if leave_request.status != 'pending_manager':
-        return jsonify({"error": "Leave request is not pending manager approval"}), 400
+    request_list = []
+    for leave, emp_id, full_name in rows:
+        request_list.append({
+            "id": leave.id,
+            "employee_id": leave.employee_id,
+            "emp_id": emp_id,
+            "employee_name": full_name or "Unknown",
+            "start_date": leave.start_date.strftime('%Y-%m-%d'),
+            "end_date": leave.end_date.strftime('%Y-%m-%d'),
+            "reason": leave.reason,
+            "status": leave.status
+        })
+
+    return jsonify({
+        "leave_requests": request_list,
+        "next_cursor": next_cursor
+    }), 200
+
+@manager_bp.route('/api/manager/availability', methods=['GET'])
+@manager_required
+def get_team_availability():
+    return availability_response(User.manager_id == current_principal().id)
 
+@manager_bp.route('/api/manager/leave-requests/bulk', methods=['PUT'])
+@manager_required
+def manager_bulk_update_leave_requests():
+    return bulk_transition('pending_manager', ('pending_admin', 'rejected'), manager_id=current_principal().id)
+
+@manager_bp.route('/api/manager/leave-requests/<int:request_id>', methods=['PUT'])
+@manager_required
+def manager_update_leave_request(request_id):
     try:
-        leave_request.status = 'pending_admin'
+        # One status-guarded UPDATE that also checks the request is from one of the manager's reports
+        result, _ = transition_leave_requests(
+            [request_id], 'pending_manager', 'pending_admin', manager_id=current_principal().id
+        )[request_id]
+        if result != 'updated':
+            db.session.rollback()
+            if result == 'not_found':
+                return jsonify({"error": "Leave request not found"}), 404
+            if result == 'forbidden':
+                return jsonify({"error": "Leave request is not from one of your reports"}), 403
+            return jsonify({"error": "Leave request is not pending manager approval"}), 400
         db.session.commit()
         return jsonify({"message": "Leave request forwarded to admin"}), 200
     except Exception as e:
@@ -0,0 +1,105 @@
+"""Time the admin availability endpoint for one large department on a throwaway SQLite database.
+
+    python scripts/bench_availability.py --members 2000 --days 90 --runs 10
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def seed(db, members, start, days, absence_rate, rnd):
+    from models import Department, User, EmployeeProfile, LeaveRequest, Attendance
+
+    department = Department(name='Bench')
+    db.session.add(department)
+    db.session.flush()
+    admin = User(emp_id='ADMIN', email='admin@bench', password_hash='x', role='admin')
+    db.session.add(admin)
+    db.session.flush()
+    db.session.execute(User.__table__.insert(), [
+        {"emp_id": f'B{i:05d}', "email": f'b{i}@bench', "password_hash": 'x', "role": 'employee',
+         "department_id": department.id}
+        for i in range(members)
+    ])
+    user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.department_id == department.id)]
+    db.session.execute(EmployeeProfile.__table__.insert(), [
+        {"user_id": user_id, "full_name": f'Person {user_id}'} for user_id in user_ids
+    ])
+
+    # A few leave requests per person around the window, never overlapping
+    leaves = []
+    for user_id in user_ids:
+        day = start - timedelta(days=rnd.randrange(60))
+        while day < start + timedelta(days=days + 60):
+            length = rnd.randrange(1, 8)
+            leaves.append({"employee_id": user_id, "start_date": day, "end_date": day + timedelta(days=length - 1),
+                           "status": rnd.choice(('approved', 'pending_admin', 'pending_manager', 'rejected'))})
+            day += timedelta(days=length + rnd.randrange(20, 90))
+    db.session.execute(LeaveRequest.__table__.insert(), leaves)
+
+    attendance = []
+    for user_id in user_ids:
+        for offset in range(days):
+            roll = rnd.random()
+            status = 'present' if roll >= absence_rate else ('absent' if roll < absence_rate / 2 else 'leave')
+            attendance.append({"user_id": user_id, "date": start + timedelta(days=offset), "status": status})
+    db.session.execute(Attendance.__table__.insert(), attendance)
+    db.session.commit()
+    return department.id, admin, len(leaves), len(attendance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--absence-rate', type=float, default=0.05,
+                        help='Share of attendance rows marked absent or leave.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    path = tempfile.mktemp(suffix='.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from models import db
+    from principals import principal_claims
+
+    app = create_app()
+    start = date(2026, 1, 5)
+    try:
+        with app.app_context():
+            department_id, admin, leaves, attendance = seed(
+                db, args.members, start, args.days, args.absence_rate, random.Random(args.seed)
+            )
+            token = create_access_token(identity=str(admin.id), additional_claims=principal_claims(admin))
+        print(f"{args.members} members, {leaves} leave requests, {attendance} attendance rows")
+
+        client = app.test_client()
+        url = (f'/api/admin/availability?department_id={department_id}'
+               f'&from={start:%Y-%m-%d}&to={start + timedelta(days=args.days - 1):%Y-%m-%d}')
+        headers = {'Authorization': f'Bearer {token}'}
+        client.get(url, headers=headers)
+
+        timings = []
+        for _ in range(args.runs):
+            began = time.perf_counter()
+            response = client.get(url, headers=headers)
+            timings.append((time.perf_counter() - began) * 1000)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        print(f"response: {len(response.get_data())} bytes")
+        print(f"latency ms: median {statistics.median(timings):.1f}  min {min(timings):.1f}  max {max(timings):.1f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
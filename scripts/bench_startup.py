@@ -0,0 +1,53 @@
+"""Measure worker cold-start cost: import time, create_app() time and RSS.
+
+    python scripts/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+app_module.create_app()
+created = time.perf_counter()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform != 'darwin':
+    rss *= 1024
+print(json.dumps({
+    "import_s": imported - start,
+    "create_app_s": created - imported,
+    "max_rss_mb": rss / 2 ** 20,
+    "reportlab_loaded": 'reportlab' in sys.modules,
+}))
+"""
+
+
+def sample():
+    # A fresh interpreter per sample so nothing is shared between runs
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [sample() for _ in range(args.runs)]
+    for field in ('import_s', 'create_app_s', 'max_rss_mb'):
+        values = [s[field] for s in samples]
+        print(f"{field:>14}: median {statistics.median(values):.3f}  min {min(values):.3f}  max {max(values):.3f}")
+    print(f"{'reportlab':>14}: {'loaded' if any(s['reportlab_loaded'] for s in samples) else 'not loaded'}")
+
+
+if __name__ == '__main__':
+    main()